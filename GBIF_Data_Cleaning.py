@@ -1,186 +1,90 @@
 # --- Code cell ---
-import pandas as pd
-import numpy as np
-import re
+from snapshots import load_csv
 
 # ===============================
 # Load dataset
 # ===============================
 file_path = r"D:\APP_project\dataset_2.csv"
-df = pd.read_csv(file_path)
+df = load_csv(file_path)
 
-print("\n==============================")
-print("BASIC INFO")
-print("==============================")
+# ===============================
+# Profile missing values and inconsistencies
+# ===============================
+# One pass over the columns computes the missing-value tables and every
+# inconsistency check (coordinates, years, individualCount, uncertainty,
+# country codes, blank-like text) without building filtered copies.
+from profiling import print_profile, profile_frame, save_profile
+
+profile = profile_frame(df)
 print("Shape (rows, columns):", df.shape)
+print_profile(profile)
 
-# ===============================
-# 1. Missing & Empty Checks
-# ===============================
-print("\n==============================")
-print("MISSING VALUES (COUNT)")
-print("==============================")
-missing_count = df.isna().sum()
-print(missing_count)
-
-print("\n==============================")
-print("MISSING VALUES (%)")
-print("==============================")
-missing_percent = (df.isna().mean() * 100).round(2)
-print(missing_percent)
-
-print("\n==============================")
-print("COMPLETELY EMPTY COLUMNS")
-print("==============================")
-empty_cols = missing_count[missing_count == len(df)].index.tolist()
-print(empty_cols)
-
-# ===============================
-# 2. Inconsistency Checks
-# ===============================
-print("\n==============================")
-print("INCONSISTENCY CHECKS")
-print("==============================")
-
-# ---- Coordinate checks (fixed for old pandas) ----
-df["decimalLatitude"] = pd.to_numeric(df["decimalLatitude"], errors="coerce")
-df["decimalLongitude"] = pd.to_numeric(df["decimalLongitude"], errors="coerce")
-
-invalid_lat = df[
-    (df["decimalLatitude"].notna()) &
-    ((df["decimalLatitude"] < -90) | (df["decimalLatitude"] > 90))
-]
-
-invalid_lon = df[
-    (df["decimalLongitude"].notna()) &
-    ((df["decimalLongitude"] < -180) | (df["decimalLongitude"] > 180))
-]
-
-print("Invalid latitudes:", len(invalid_lat))
-print("Invalid longitudes:", len(invalid_lon))
-
-# ---- Year validation ----
-if "year" in df.columns:
-    df["year"] = pd.to_numeric(df["year"], errors="coerce")
-    invalid_year = df[(df["year"].notna()) & ((df["year"] < 1700) | (df["year"] > 2025))]
-    print("Invalid years:", len(invalid_year))
-
-# ---- Negative individualCount ----
-if "individualCount" in df.columns:
-    df["individualCount"] = pd.to_numeric(df["individualCount"], errors="coerce")
-    neg_individuals = df[df["individualCount"] < 0]
-    print("Negative individualCount:", len(neg_individuals))
-
-# ---- Coordinate uncertainty consistency ----
-if "coordinateUncertaintyInMeters" in df.columns:
-    df["coordinateUncertaintyInMeters"] = pd.to_numeric(df["coordinateUncertaintyInMeters"], errors="coerce")
-    bad_uncertainty = df[df["coordinateUncertaintyInMeters"] < 0]
-    print("Negative coordinateUncertaintyInMeters:", len(bad_uncertainty))
-
-# ---- Country code checks ----
-if "countryCode" in df.columns:
-    invalid_country = df[
-        df["countryCode"].notna() &
-        ~df["countryCode"].astype(str).str.match(r"^[A-Z]{2}$")
-    ]
-    print("Invalid country codes:", len(invalid_country))
-
-# ---- Messy blank text fields ----
-text_cols = ["stateProvince", "locality", "habitat"]
-for col in text_cols:
-    if col in df.columns:
-        blank_like = df[
-            df[col].astype(str).str.strip().isin(["", "nan", "None"])
-        ]
-        print(f"Blank-like values in {col}:", len(blank_like))
+profile_path = r"D:\APP_project\dataset_2_profile.json"
+save_profile(profile, profile_path)
+print("\nProfile saved at:", profile_path)
 
 
 # --- Code cell ---
-import pandas as pd
+from manifest import StepRun, file_info, manifest_path
+from rules import DEFAULT_RULES_PATH, load_rules
+from snapshots import load_csv
 
 # ===============================
 # Load dataset
 # ===============================
+# The run (input hashes, rows, time and memory of each step, outputs) is
+# recorded in a manifest next to the cleaned CSV, see step 7.
 file_path = r"D:\APP_project\dataset_2.csv"
-df = pd.read_csv(file_path)
+run = StepRun("clean", {"raw": file_info(file_path), "rules": file_info(DEFAULT_RULES_PATH)})
 
-print("Original shape:", df.shape)
-
-# ===============================
-# 1. Drop completely empty columns
-# ===============================
-empty_cols = [
-    'verbatimScientificNameAuthorship',
-    'locality',
-    'individualCount',
-    'coordinatePrecision',
-    'elevation', 'elevationAccuracy',
-    'depth', 'depthAccuracy',
-    'recordNumber',
-    'typeStatus',
-    'establishmentMeans'
-]
+with run.stage("load"):
+    df = load_csv(file_path)
 
-df = df.drop(columns=empty_cols, errors="ignore")
-print("After dropping empty columns:", df.shape)
-
-# ===============================
-# 2. Clean text-like columns
-# ===============================
-text_cols = ["stateProvince", "mediaType"]
-
-for col in text_cols:
-    if col in df.columns:
-        df[col] = df[col].astype(str).str.strip()
-        df[col] = df[col].replace({"nan": pd.NA, "None": pd.NA, "": pd.NA})
-
-# ===============================
-# 3. Handle partial missing values
-# ===============================
-# Fill countryCode missing
-df["countryCode"] = df["countryCode"].fillna("Unknown")
-
-# Flag missing speciesKey
-df["speciesKey_missing"] = df["speciesKey"].isna()
+print("Original shape:", df.shape)
 
 # ===============================
-# 4. Date Parsing
+# 1-5. Drop empty columns, clean text, parse dates,
+#      filter years, coordinates and uncertainty
 # ===============================
-df["eventDate"] = pd.to_datetime(df["eventDate"], errors="coerce")
+# Columns to drop, year window, coordinate ranges and uncertainty limit
+# come from the rules file; edit or copy it to tune them for a region.
+# Row-range shards are cleaned on a process pool and put back together in
+# their original order; WORKERS = 1 runs everything in this process.
+# Run as a script, this file has no `if __name__ == "__main__":` guard, so
+# on Windows and macOS every worker would re-run it on start: only raise
+# WORKERS (e.g. to cleaning.DEFAULT_WORKERS) in the notebook.
+from cleaning import parallel_clean, print_rejected
+from manifest import sampling_memory
 
-df["year"] = df["eventDate"].dt.year
-df["month"] = df["eventDate"].dt.month
-df["day"] = df["eventDate"].dt.day
+RULES = load_rules(DEFAULT_RULES_PATH)
+WORKERS = 1
 
-# Keep only reasonable year range
-df = df[df["year"].between(1800, 2025)]
+stages = {}
+rejected = {}
+timings = {}
+memory = {}
+with run.stage("clean"), sampling_memory():
+    df = parallel_clean(df, stages, workers=WORKERS, rules=RULES, rejected=rejected, timings=timings,
+                        memory=memory)
+for stage, rows in stages.items():
+    print(f"Rows after {stage}:", rows)
+print_rejected(rejected)
 
 # ===============================
-# 5. Coordinate Cleaning
+# 6. Drop empty and nearly empty columns, narrow numeric types
 # ===============================
-df["decimalLatitude"] = pd.to_numeric(df["decimalLatitude"], errors="coerce")
-df["decimalLongitude"] = pd.to_numeric(df["decimalLongitude"], errors="coerce")
+# The column schema is saved next to the cleaned CSV; convert_data.py and
+# the EDA loader read only the columns it keeps, with its types.
+from cleaning import print_schema
+from schema_inference import column_stats, infer_schema, prune_columns, save_schema, schema_path
 
-df = df[
-    df["decimalLatitude"].between(-90, 90) &
-    df["decimalLongitude"].between(-180, 180)
-]
-
-# Clean coordinate uncertainty
-df["coordinateUncertaintyInMeters"] = pd.to_numeric(
-    df["coordinateUncertaintyInMeters"],
-    errors="coerce"
-)
-
-MAX_UNCERTAINTY = 10000  # 10 km threshold
-
-df = df[
-    df["coordinateUncertaintyInMeters"].isna() |
-    (df["coordinateUncertaintyInMeters"] <= MAX_UNCERTAINTY)
-]
+with run.stage("schema"):
+    schema = infer_schema(column_stats(df), RULES)
+    df = prune_columns(df, schema)
+print_schema(schema)
 
 # ===============================
-# 6. Final checks
+# 6b. Final checks
 # ===============================
 print("Final shape:", df.shape)
 
@@ -191,12 +95,47 @@ print((df.isna().mean() * 100).round(2).sort_values(ascending=False))
 # 7. Save cleaned dataset
 # ===============================
 clean_path = r"D:\APP_project\gbif_cleaned.csv"
-df.to_csv(clean_path, index=False)
+with run.stage("save"):
+    df.to_csv(clean_path, index=False)
+    save_schema(schema, schema_path(clean_path))
+
+run.record["rows"] = dict(stages, written=len(df))
+run.finish(
+    {"cleaned": clean_path, "schema": schema_path(clean_path)},
+    step_seconds={step: round(seconds, 3) for step, seconds in timings.items()},
+    step_memory=memory,
+    rejected=rejected,
+    schema=schema,
+)
+run.save(manifest_path(clean_path))
 
 print("\n✅ Cleaned dataset saved at:")
 print(clean_path)
 
 
 # --- Code cell ---
+# ===============================
+# Streaming mode for large GBIF exports
+# ===============================
+# Runs the same checks and filters chunk by chunk, so memory stays bounded
+# by the chunk size instead of the size of the raw export. With several
+# workers, chunks are cleaned in parallel and written in input order
+# (see WORKERS in step 1-5 before raising it).
+# If the manifest next to the output shows the same raw file and rules,
+# and the outputs are untouched, the run is skipped; FORCE re-runs it.
+from cleaning import run_cleaning, print_report
 
+WORKERS = 1
+FORCE = False
+
+raw_path = r"D:\APP_project\dataset_2.csv"
+clean_path = r"D:\APP_project\gbif_cleaned.csv"
 
+report = run_cleaning(raw_path, clean_path, chunksize=250_000, workers=WORKERS, force=FORCE)
+if report is None:
+    print("Input and rules unchanged since the last run, cleaning skipped.")
+else:
+    print_report(report)
+
+print("\n✅ Cleaned dataset saved at:")
+print(clean_path)
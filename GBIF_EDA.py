@@ -1,32 +1,38 @@
 # --- Code cell ---
-import pandas as pd
+from snapshots import load_cleaned
+from taxonomy import TaxonomyCounts
 
 # Load cleaned data
 file_path = r"D:\APP_project\gbif_cleaned.csv"
-df = pd.read_csv(file_path)
+df = load_cleaned(file_path)
+
+# Counts for every taxonomic rank from one pass over the records
+taxonomy = TaxonomyCounts(df)
 
 print("===================================")
 print("KINGDOM DISTRIBUTION")
 print("===================================")
-print(df["kingdom"].value_counts())
+print(taxonomy.counts("kingdom"))
 
 print("\n===================================")
 print("PHYLUM DISTRIBUTION (Top 10)")
 print("===================================")
-print(df["phylum"].value_counts().head(10))
+print(taxonomy.counts("phylum").head(10))
 
 print("\n===================================")
 print("ORDER DISTRIBUTION (Top 10)")
 print("===================================")
-print(df["order"].value_counts().head(10))
+print(taxonomy.counts("order").head(10))
 
 
 # --- Code cell ---
-import pandas as pd
+from snapshots import load_cleaned
+from taxonomy import TaxonomyCounts
 
 # Load cleaned dataset
 file_path = r"D:\APP_project\gbif_cleaned.csv"
-df = pd.read_csv(file_path)
+df = load_cleaned(file_path)
+taxonomy = TaxonomyCounts(df)
 
 # List of taxonomic columns
 taxonomy_cols = [
@@ -45,19 +51,27 @@ for col in taxonomy_cols:
         print("\n" + "="*50)
         print(f"{col.upper()} DISTRIBUTION")
         print("="*50)
-        print(df[col].value_counts())
+        print(taxonomy.counts(col))
     else:
         print(f"\n⚠️ Column '{col}' not found in dataset")
 
+# Records per order within each class
+print("\n" + "="*50)
+print("ORDERS WITHIN EACH CLASS")
+print("="*50)
+print(taxonomy.rollup("class", "order"))
+
 
 # --- Code cell ---
-import pandas as pd
 import matplotlib.pyplot as plt
+from snapshots import load_cleaned
+from taxonomy import TaxonomyCounts
 
 file_path = r"D:\APP_project\gbif_cleaned.csv"
-df = pd.read_csv(file_path)
+df = load_cleaned(file_path)
+taxonomy = TaxonomyCounts(df)
 
-counts = df["kingdom"].value_counts()
+counts = taxonomy.counts("kingdom")
 total = counts.sum()
 
 plt.figure(figsize=(10,6))
@@ -94,16 +108,18 @@ plt.show()
 
 # --- Code cell ---
 # Top-10 Phylum Distribution Plot
-import pandas as pd
 import matplotlib.pyplot as plt
+from snapshots import load_cleaned
+from taxonomy import TaxonomyCounts
 
 # Load cleaned dataset
 file_path = r"D:\APP_project\gbif_cleaned.csv"
-df = pd.read_csv(file_path)
+df = load_cleaned(file_path)
+taxonomy = TaxonomyCounts(df)
 
 # Get Top 10 Phyla
-counts = df["phylum"].value_counts().head(10)
-total = df["phylum"].value_counts().sum()
+counts = taxonomy.counts("phylum").head(10)
+total = taxonomy.total("phylum")
 
 plt.figure(figsize=(10,6))
 bars = plt.bar(counts.index, counts.values)
@@ -137,8 +153,8 @@ plt.show()
 # --- Code cell ---
 # Top-10 Order Distribution Plot
 # Get Top 10 Orders
-counts = df["order"].value_counts().head(10)
-total = df["order"].value_counts().sum()
+counts = taxonomy.counts("order").head(10)
+total = taxonomy.total("order")
 
 plt.figure(figsize=(10,6))
 bars = plt.bar(counts.index, counts.values)
@@ -172,12 +188,12 @@ plt.show()
 
 # --- Code cell ---
 #Country Distribution (Bar Plot)
-import pandas as pd
 import matplotlib.pyplot as plt
+from snapshots import load_cleaned
 
 # Load cleaned data
 file_path = r"D:\APP_project\gbif_cleaned.csv"
-df = pd.read_csv(file_path)
+df = load_cleaned(file_path)
 
 # Top 20 countries
 country_counts = df["countryCode"].value_counts().head(20)
@@ -213,16 +229,22 @@ plt.show()
 
 
 # --- Code cell ---
-# Latitude vs Longitude Scatter Plot
-plt.figure(figsize=(10,6))
+# Latitude vs Longitude Density Plot
+# Points are binned into a fixed-size raster instead of drawn one by one,
+# so the plot costs the same for any number of records
+import raster
 
-plt.scatter(
-    df["decimalLongitude"],
+image = raster.render(
     df["decimalLatitude"],
-    s=3,
-    alpha=0.5
+    df["decimalLongitude"],
+    how="eq_hist"
 )
 
+plt.figure(figsize=(10,6))
+
+west, east, south, north = raster.GLOBAL_EXTENT
+plt.imshow(image, extent=(west, east, south, north), interpolation="nearest")
+
 plt.title("Global Distribution of Observations", fontsize=16, fontweight="bold")
 plt.xlabel("Longitude")
 plt.ylabel("Latitude")
@@ -0,0 +1,77 @@
+"""
+Aggregates shown by the dashboard, computed from a (filtered) occurrence frame.
+"""
+
+import pandas as pd
+
+from taxonomy import TaxonomyCounts
+
+
+def summary_metrics(df):
+    return {
+        "records": len(df),
+        "species": int(df["species"].nunique()),
+        "genera": int(df["genus"].nunique()),
+        "families": int(df["family"].nunique()),
+    }
+
+
+def yearly_counts(df):
+    return df.groupby("year", observed=True).size().reset_index(name="count")
+
+
+def monthly_counts(df):
+    return df.groupby("month", observed=True).size().reset_index(name="count")
+
+
+def top_values(df, col, n=10):
+    """The ``n`` most frequent values of ``col``, missing values as "Unknown"."""
+    values = df[col].astype(object).fillna("Unknown")
+    counts = values.value_counts().head(n)
+    return pd.DataFrame({"value": counts.index, "count": counts.to_numpy()})
+
+
+class FrameView:
+    """
+    Aggregates of one filtered frame. Its methods mirror the functions
+    above; the taxonomy is factorized once and shared by the distinct
+    counts and every taxonomy level's top values.
+
+    ``taxonomy`` is an optional function returning the frame's
+    TaxonomyCounts (e.g. from a cache); by default they are computed on
+    first use.
+    """
+
+    def __init__(self, df, taxonomy=None):
+        self.df = df
+        self._taxonomy = None
+        self._get_taxonomy = taxonomy or (lambda: TaxonomyCounts(self.df))
+
+    @property
+    def taxonomy(self):
+        if self._taxonomy is None:
+            self._taxonomy = self._get_taxonomy()
+        return self._taxonomy
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the frame and, once built, its taxonomy counts."""
+        size = int(self.df.memory_usage(index=True).sum())
+        return size + (self._taxonomy.nbytes if self._taxonomy is not None else 0)
+
+    def summary_metrics(self):
+        return {
+            "records": len(self.df),
+            "species": self.taxonomy.distinct("species"),
+            "genera": self.taxonomy.distinct("genus"),
+            "families": self.taxonomy.distinct("family"),
+        }
+
+    def yearly_counts(self):
+        return yearly_counts(self.df)
+
+    def monthly_counts(self):
+        return monthly_counts(self.df)
+
+    def top_values(self, col, n=10):
+        return self.taxonomy.top_values(col, n)
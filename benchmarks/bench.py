@@ -0,0 +1,404 @@
+"""
+Benchmarks for the cleaning, conversion and dashboard query paths.
+
+    python -m benchmarks.bench --rows 100000 1000000 10000000
+
+For each size a synthetic raw download (see synthetic.py) is generated
+once under ``--workdir`` and run through the pipeline: streamed cleaning,
+conversion to Parquet and the cube build. Each stage runs in its own
+process, so its peak memory is its own; throughput is input rows per
+second.
+
+The dashboard's query paths are then run headlessly (no Streamlit) on the
+converted data, ``--repeat`` times each with random filter selections:
+resolving the filters through the index, the frame groupbys, the taxonomy
+value counts, the cube aggregates, species search, viewport lookups, the
+map payload (grid cells rendered into the Folium map) and the CSV export.
+Latency percentiles and throughput are recorded for each.
+
+Every run is appended to the results file (``benchmarks/results.json``)
+with the commit, library versions and host, and compared with the previous
+run on the same host; ``--check`` exits with status 1 when a stage or query
+got slower by more than ``--tolerance``.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_WORKDIR = os.path.join(BENCH_DIR, "data")
+DEFAULT_RESULTS = os.path.join(BENCH_DIR, "results.json")
+
+DEFAULT_ROWS = [100_000]
+DEFAULT_REPEAT = 20
+DEFAULT_TOLERANCE = 0.25
+# Smaller slowdowns are timer noise, whatever their ratio
+MIN_SLOWDOWN_SECONDS = 0.002
+
+PERCENTILES = [50, 90, 99]
+
+
+# ===============================
+# Pipeline stages
+# ===============================
+# Each runs in a fresh process (see _in_process) and returns its input rows.
+def _generate(n_rows, raw_path, seed):
+    from benchmarks.synthetic import write_raw_csv
+
+    write_raw_csv(n_rows, raw_path, seed)
+    return n_rows
+
+
+def _clean(raw_path, clean_path, workers):
+    from cleaning import stream_clean
+
+    report = stream_clean(raw_path, clean_path, workers=workers)
+    return report["profile"]["rows"]
+
+
+def _convert(clean_path, data_path):
+    import data_access
+    from convert_data import convert_csv_to_parquet
+
+    convert_csv_to_parquet(clean_path, data_path)
+    return data_access.open_dataset(data_path).count_rows()
+
+
+def _build_cube(data_path, cube_path):
+    import data_access
+    from cube import build_cube
+
+    build_cube(data_path, cube_path)
+    return data_access.open_dataset(data_path).count_rows()
+
+
+def _measured(func, *args):
+    from manifest import peak_memory_mb
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func(*args)
+    return result, time.perf_counter() - start, peak_memory_mb()
+
+
+def _in_process(func, *args):
+    """``func(*args)`` in a new process: (result, seconds, peak memory in MB)."""
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(_measured, func, *args).result()
+
+
+def _stage_record(rows, seconds, peak_mb):
+    return {
+        "seconds": round(seconds, 3),
+        "rows": rows,
+        "rows_per_second": round(rows / seconds) if seconds > 0 else None,
+        "peak_memory_mb": peak_mb,
+    }
+
+
+# ===============================
+# Dashboard query paths
+# ===============================
+def _random_selection(rng, metadata):
+    """Sidebar selections as the dashboard builds them; None is "all"."""
+    countries, kingdoms, years = metadata["countryCode"], metadata["kingdom"], metadata["year"]
+    selection = {"countryCode": None, "kingdom": None, "year": None}
+    if rng.random() < 0.5:
+        selection["countryCode"] = countries[rng.integers(len(countries))]
+    if rng.random() < 0.3 and len(kingdoms) > 1:
+        picked = rng.choice(len(kingdoms), rng.integers(1, len(kingdoms)), replace=False)
+        selection["kingdom"] = [kingdoms[i] for i in sorted(picked)]
+    if rng.random() < 0.5:
+        start = rng.integers(len(years))
+        selection["year"] = years[start:start + int(rng.integers(5, 21))]
+    return selection
+
+
+def _species_query(rng, names):
+    # A prefix of a name, or the name with two letters swapped (a typo)
+    name = names[min(int(rng.zipf(1.3)) - 1, len(names) - 1)].lower()
+    if rng.random() < 0.5 or len(name) < 4:
+        return name[:int(rng.integers(3, max(len(name), 4)))]
+    i = int(rng.integers(1, len(name) - 2))
+    return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+
+
+def _latency_record(seconds, rows):
+    ms = np.asarray(seconds) * 1000
+    record = {f"p{p}_ms": round(float(np.percentile(ms, p)), 3) for p in PERCENTILES}
+    record["max_ms"] = round(float(ms.max()), 3)
+    record["mean_ms"] = round(float(ms.mean()), 3)
+    total = float(np.sum(seconds))
+    record["rows_per_second"] = round(sum(rows) / total) if total > 0 and sum(rows) else None
+    return record
+
+
+def _run_queries(data_path, cube_path, repeat, seed, workdir):
+    """Load the dashboard's data and time each query path; runs in its own process."""
+    import folium
+
+    import aggregates
+    import data_access
+    import export
+    import map_layers
+    import spatial
+    from cube import load_cube
+    from filter_index import FilterIndex, intersect
+    from manifest import peak_memory_mb
+    from species_index import SpeciesIndex
+
+    stages = {}
+
+    def timed(name, compute):
+        start = time.perf_counter()
+        value = compute()
+        stages[name] = {"seconds": round(time.perf_counter() - start, 3)}
+        return value
+
+    df = timed("load_view", lambda: data_access.read_view(path=data_path))
+    filter_index = timed("filter_index", lambda: FilterIndex(df, lowercase=()))
+    species_index = timed("species_index", lambda: SpeciesIndex(df["species"]))
+    grid_index = timed("grid_index", lambda: spatial.GridIndex(df["decimalLatitude"], df["decimalLongitude"]))
+    cube = timed("load_cube", lambda: load_cube(cube_path, data_path))
+    for name in stages:
+        stages[name]["rows"] = len(df)
+    metadata = {col: filter_index.values(col) for col in ["countryCode", "kingdom", "year"]}
+
+    rng = np.random.default_rng(seed)
+    selections = [_random_selection(rng, metadata) for _ in range(repeat)]
+    export_path = os.path.join(workdir, f"export-{os.getpid()}.csv")
+
+    def view_of(rows):
+        return df if rows is None else df.take(rows)
+
+    def map_payload(view):
+        cells = spatial.bin_points(view["decimalLatitude"], view["decimalLongitude"], 3, spatial.DEFAULT_MAX_CELLS)
+        m = folium.Map(location=[20, 0], zoom_start=3, prefer_canvas=True)
+        map_layers.cluster_layer(cells).add_to(m)
+        return len(m.get_root().render())
+
+    def csv_export(selection):
+        export.write_export(export_path, "CSV", data_access.build_filter(
+            country=selection["countryCode"], kingdoms=selection["kingdom"], years=selection["year"],
+        ), path=data_path)
+
+    def cube_aggregates(selection):
+        view = cube.select(**selection)
+        view.summary_metrics()
+        view.yearly_counts()
+        view.monthly_counts()
+        for col in data_access.TAXONOMY_COLUMNS:
+            view.top_values(col)
+
+    def frame_value_counts(view):
+        frame_view = aggregates.FrameView(view)
+        frame_view.summary_metrics()
+        for col in data_access.TAXONOMY_COLUMNS:
+            frame_view.top_values(col)
+
+    seconds, rows = {}, {}
+
+    def measure(name, compute, n_rows):
+        start = time.perf_counter()
+        value = compute()
+        seconds.setdefault(name, []).append(time.perf_counter() - start)
+        rows.setdefault(name, []).append(n_rows)
+        return value
+
+    for selection in selections:
+        filter_rows = measure("filter_resolve", lambda: filter_index.resolve(**selection), len(df))
+        view = measure("filter_take", lambda: view_of(filter_rows), len(df))
+        measure("groupby_year_month", lambda: (aggregates.yearly_counts(view), aggregates.monthly_counts(view)),
+                len(view))
+        measure("taxonomy_value_counts", lambda: frame_value_counts(view), len(view))
+        if cube is not None:
+            measure("cube_aggregates", lambda: cube_aggregates(selection), len(cube.cells))
+        measure("map_payload", lambda: map_payload(view), len(view))
+        measure("csv_export", lambda: csv_export(selection), len(view))
+
+        # A 20 x 10 degree window somewhere in the populated latitudes
+        south, west = rng.uniform(-50, 60), rng.uniform(-180, 160)
+        measure("viewport_query", lambda: intersect(grid_index.query(south, west, south + 10, west + 20), filter_rows),
+                len(df))
+
+        query = _species_query(rng, species_index.names)
+        measure("species_search", lambda: species_index.search(query), len(species_index))
+
+    if os.path.exists(export_path):
+        os.remove(export_path)
+    queries = {name: _latency_record(seconds[name], rows[name]) for name in seconds}
+    return {"stages": stages, "queries": queries, "peak_memory_mb": peak_memory_mb()}
+
+
+# ===============================
+# Runs and results
+# ===============================
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def host_info():
+    import pandas as pd
+    import pyarrow as pa
+
+    return {
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "pyarrow": pa.__version__,
+    }
+
+
+def bench_size(n_rows, workdir, workers, repeat, seed=0, regenerate=False):
+    """Run the pipeline and the query paths on ``n_rows`` synthetic records."""
+    prefix = os.path.join(workdir, f"bench_{n_rows}_{seed}")
+    raw_path = prefix + "_raw.csv"
+    clean_path = prefix + "_clean.csv"
+    data_path = prefix + ".parquet"
+    cube_path = prefix + "_cube.parquet"
+
+    stages = {}
+    if regenerate or not os.path.exists(raw_path):
+        print(f"  generating {n_rows:,} rows...")
+        stages["generate"] = _stage_record(*_in_process(_generate, n_rows, raw_path, seed))
+
+    for name, func, args in [
+        ("clean", _clean, (raw_path, clean_path, workers)),
+        ("convert", _convert, (clean_path, data_path)),
+        ("cube", _build_cube, (data_path, cube_path)),
+    ]:
+        print(f"  {name}...")
+        stages[name] = _stage_record(*_in_process(func, *args))
+
+    print("  queries...")
+    result, _, _ = _in_process(_run_queries, data_path, cube_path, repeat, seed, workdir)
+    stages.update(result["stages"])
+    return {"stages": stages, "queries": result["queries"], "query_peak_memory_mb": result["peak_memory_mb"]}
+
+
+def load_results(path):
+    if not os.path.exists(path):
+        return {"runs": []}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_results(results, path):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def previous_run(results, run):
+    """The latest earlier run on the same kind of host, or None."""
+    def same_host(other):
+        return all(other["host"].get(key) == run["host"][key] for key in ("machine", "cpu_count"))
+
+    earlier = [other for other in results["runs"] if other is not run and same_host(other)]
+    return earlier[-1] if earlier else None
+
+
+def compare_runs(previous, current, tolerance=DEFAULT_TOLERANCE):
+    """
+    Print the change of every stage time and median query latency between
+    two runs; return the names of those slower by more than ``tolerance``
+    (and by at least MIN_SLOWDOWN_SECONDS).
+    """
+    regressions = []
+    for size, result in current["sizes"].items():
+        before = previous["sizes"].get(size)
+        if before is None:
+            continue
+        print(f"\n{int(size):,} rows (vs {previous['commit'] or previous['started_at']}):")
+        # (name, before, now, seconds per unit)
+        pairs = [(f"stage {name} (s)", before["stages"].get(name, {}).get("seconds"), record["seconds"], 1)
+                 for name, record in result["stages"].items()]
+        pairs += [(f"query {name} p50 (ms)", before["queries"].get(name, {}).get("p50_ms"), record["p50_ms"], 1e-3)
+                  for name, record in result["queries"].items()]
+        for name, old, new, unit in pairs:
+            if not old or new is None:
+                continue
+            change = new / old - 1
+            slower = change > tolerance and (new - old) * unit >= MIN_SLOWDOWN_SECONDS
+            flag = "  REGRESSION" if slower else ""
+            print(f"  {name:<38} {old:>10.3f} -> {new:>10.3f}  {change:+7.1%}{flag}")
+            if flag:
+                regressions.append(f"{size}: {name}")
+    return regressions
+
+
+def print_run(run):
+    for size, result in run["sizes"].items():
+        print(f"\n{int(size):,} rows")
+        for name, record in result["stages"].items():
+            throughput = f"{record['rows_per_second']:>12,} rows/s" if record.get("rows_per_second") else ""
+            memory = f"{record['peak_memory_mb']:>8} MB" if record.get("peak_memory_mb") else ""
+            print(f"  {name:<24} {record['seconds']:>9.3f} s {throughput} {memory}")
+        for name, record in result["queries"].items():
+            print(f"  {name:<24} p50 {record['p50_ms']:>9.3f} ms  p99 {record['p99_ms']:>9.3f} ms")
+
+
+def main(argv=None):
+    from cleaning import DEFAULT_WORKERS
+
+    parser = argparse.ArgumentParser(description="Benchmark the GBIF cleaning, conversion and dashboard queries")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS,
+                        help="dataset sizes to run, e.g. 100000 1000000 10000000")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="random selections per query path")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="cleaning worker processes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=DEFAULT_WORKDIR, help="where the synthetic data is kept")
+    parser.add_argument("--regenerate", action="store_true", help="generate the data even if it exists")
+    parser.add_argument("--results", default=DEFAULT_RESULTS)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="slowdown reported as a regression (0.25 = 25%%)")
+    parser.add_argument("--check", action="store_true", help="exit with status 1 on regressions")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.workdir, exist_ok=True)
+    run = {
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "host": host_info(),
+        "settings": {"repeat": args.repeat, "workers": args.workers, "seed": args.seed},
+        "sizes": {},
+    }
+    for n_rows in args.rows:
+        print(f"{n_rows:,} rows:")
+        run["sizes"][str(n_rows)] = bench_size(n_rows, args.workdir, args.workers, args.repeat,
+                                               args.seed, args.regenerate)
+    print_run(run)
+
+    results = load_results(args.results)
+    results["runs"].append(run)
+    save_results(results, args.results)
+    print(f"\nResults appended to {args.results}")
+
+    previous = previous_run(results, run)
+    regressions = compare_runs(previous, run, args.tolerance) if previous else []
+    if regressions and args.check:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
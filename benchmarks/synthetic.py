@@ -0,0 +1,212 @@
+"""
+Synthetic GBIF-shaped occurrence data for the benchmarks.
+
+Rows have the columns of a raw GBIF download (the input of the cleaning
+step) and the skew of real ones:
+
+- a consistent taxonomy tree (kingdom -> ... -> species) whose species
+  are drawn from a Zipf-like distribution, so a few species hold most
+  records;
+- coordinates clustered around weighted hotspots, each in one country,
+  plus a uniform background;
+- event dates concentrated in recent years, in the ISO 8601 forms GBIF
+  uses (dates, timestamps, year-months, intervals), some blank;
+- a small share of values the cleaning rejects (out-of-range coordinates
+  and years, large or negative uncertainties, blank text).
+
+The data is generated chunk by chunk from a seed, so any size can be
+written without holding it in memory and every run sees the same rows.
+"""
+
+import numpy as np
+import pandas as pd
+
+CHUNK_ROWS = 1_000_000
+
+KINGDOMS = ["Animalia", "Plantae", "Fungi", "Bacteria", "Chromista"]
+KINGDOM_WEIGHTS = [0.70, 0.22, 0.05, 0.02, 0.01]
+
+COUNTRIES = [
+    "US", "CA", "MX", "BR", "AR", "CO", "PE", "GB", "FR", "DE", "ES", "SE", "NO", "NL",
+    "IT", "ZA", "KE", "TZ", "MG", "IN", "CN", "JP", "ID", "MY", "AU", "NZ", "RU", "TR",
+]
+
+BASIS_OF_RECORD = ["HUMAN_OBSERVATION", "PRESERVED_SPECIMEN", "MACHINE_OBSERVATION", "MATERIAL_SAMPLE"]
+BASIS_WEIGHTS = [0.80, 0.15, 0.03, 0.02]
+
+_SYLLABLES = [
+    "a", "ae", "an", "ar", "ba", "ca", "ce", "da", "di", "el", "en", "er", "fa", "go", "hy",
+    "ia", "il", "is", "la", "li", "lo", "ma", "mi", "mo", "na", "ni", "no", "op", "or", "pa",
+    "pe", "po", "ra", "re", "ri", "ro", "sa", "se", "si", "ta", "te", "ti", "to", "tu", "us",
+    "va", "vi", "xa", "ze",
+]
+
+
+def _words(rng, n, syllables=3, suffix=""):
+    """``n`` distinct pseudo-Latin words of at least ``syllables`` syllables."""
+    while len(_SYLLABLES) ** syllables < 4 * n:
+        syllables += 1
+    words = set()
+    while len(words) < n:
+        parts = rng.choice(_SYLLABLES, size=(n, syllables))
+        words.update("".join(p) + suffix for p in parts)
+    return sorted(words)[:n]
+
+
+def species_count(n_rows):
+    """Number of distinct species for a dataset of ``n_rows`` records."""
+    return int(min(200_000, max(500, 20 * np.sqrt(n_rows))))
+
+
+def build_taxonomy(n_species, seed=0):
+    """
+    DataFrame with one row per species and its ancestors at every rank,
+    ordered from the most to the least recorded species.
+    """
+    rng = np.random.default_rng(seed)
+    n_genera = max(n_species // 4, 1)
+    n_families = max(n_genera // 5, 1)
+    n_orders = max(n_families // 4, 1)
+    n_classes = max(n_orders // 5, 1)
+    n_phyla = max(n_classes // 3, len(KINGDOMS))
+
+    phylum_kingdom = np.arange(n_phyla) % len(KINGDOMS)
+    class_phylum = rng.integers(0, n_phyla, n_classes)
+    order_class = rng.integers(0, n_classes, n_orders)
+    family_order = rng.integers(0, n_orders, n_families)
+    genus_family = rng.integers(0, n_families, n_genera)
+    # Big kingdoms get more species
+    genus_weights = np.asarray(KINGDOM_WEIGHTS)[phylum_kingdom[class_phylum[order_class[family_order[genus_family]]]]]
+    species_genus = rng.choice(n_genera, n_species, p=genus_weights / genus_weights.sum())
+
+    genera = np.array([w.capitalize() for w in _words(rng, n_genera)], dtype=object)
+    epithets = np.array(_words(rng, n_species, suffix="us"), dtype=object)
+    genus = species_genus
+    family = genus_family[genus]
+    order = family_order[family]
+    klass = order_class[order]
+    phylum = class_phylum[klass]
+    return pd.DataFrame({
+        "kingdom": np.array(KINGDOMS, dtype=object)[phylum_kingdom[phylum]],
+        "phylum": np.array([f"{w.capitalize()}phyta" for w in _words(rng, n_phyla, 2)], dtype=object)[phylum],
+        "class": np.array([f"{w.capitalize()}opsida" for w in _words(rng, n_classes, 2)], dtype=object)[klass],
+        "order": np.array([f"{w.capitalize()}ales" for w in _words(rng, n_orders, 2)], dtype=object)[order],
+        "family": np.array([f"{w.capitalize()}idae" for w in _words(rng, n_families, 2)], dtype=object)[family],
+        "genus": genera[genus],
+        "species": genera[genus] + " " + epithets,
+        "speciesKey": np.arange(n_species) + 1_000_000,
+    })
+
+
+def _zipf_weights(n, exponent=1.1):
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+class Generator:
+    """Produces the chunks of one synthetic dataset."""
+
+    def __init__(self, n_rows, seed=0, n_species=None, n_hotspots=300):
+        self.n_rows = n_rows
+        self.seed = seed
+        self.taxonomy = build_taxonomy(n_species or species_count(n_rows), seed)
+        self.species_weights = _zipf_weights(len(self.taxonomy))
+
+        rng = np.random.default_rng(seed + 1)
+        self.hotspot_weights = _zipf_weights(n_hotspots, 0.9)
+        self.hotspot_lat = rng.uniform(-45, 65, n_hotspots)
+        self.hotspot_lon = rng.uniform(-170, 175, n_hotspots)
+        self.hotspot_sigma = rng.uniform(0.2, 4.0, n_hotspots)
+        self.hotspot_country = rng.choice(COUNTRIES, n_hotspots)
+
+    def chunks(self, chunk_rows=CHUNK_ROWS):
+        for i, start in enumerate(range(0, self.n_rows, chunk_rows)):
+            yield self.chunk(start, min(chunk_rows, self.n_rows - start), i)
+
+    def chunk(self, start, n, index=0):
+        rng = np.random.default_rng([self.seed, index])
+        taxa = self.taxonomy.take(rng.choice(len(self.taxonomy), n, p=self.species_weights))
+
+        # 85% of the records around hotspots, the rest anywhere
+        hotspot = rng.choice(len(self.hotspot_weights), n, p=self.hotspot_weights)
+        background = rng.random(n) < 0.15
+        lat = rng.normal(self.hotspot_lat[hotspot], self.hotspot_sigma[hotspot])
+        lon = rng.normal(self.hotspot_lon[hotspot], self.hotspot_sigma[hotspot] * 1.5)
+        lat[background] = rng.uniform(-60, 75, background.sum())
+        lon[background] = rng.uniform(-180, 180, background.sum())
+        lat = np.clip(lat, -89.9, 89.9)
+        lon = (lon + 180) % 360 - 180
+        country = self.hotspot_country[hotspot].astype(object)
+        country[background] = rng.choice(COUNTRIES, background.sum())
+        # Swapped or mistyped coordinates
+        broken = rng.random(n) < 0.005
+        lat[broken] = rng.uniform(90.5, 180, broken.sum())
+
+        # Recent years dominate; a few are before the cleaning's window
+        year = 2025 - np.minimum(rng.geometric(0.08, n) - 1, 220)
+        year[rng.random(n) < 0.002] = 1700
+        month = rng.integers(1, 13, n)
+        day = rng.integers(1, 29, n)
+        event_date = _event_dates(rng, year, month, day)
+
+        uncertainty = np.round(rng.lognormal(4, 2, n))
+        uncertainty[rng.random(n) < 0.3] = np.nan
+        uncertainty[rng.random(n) < 0.002] = -1
+
+        return pd.DataFrame({
+            "gbifID": np.arange(start, start + n, dtype=np.int64) + 1_000_000_000,
+            "occurrenceID": [f"urn:catalog:bench:{i}" for i in range(start, start + n)],
+            "kingdom": taxa["kingdom"].to_numpy(),
+            "phylum": taxa["phylum"].to_numpy(),
+            "class": taxa["class"].to_numpy(),
+            "order": taxa["order"].to_numpy(),
+            "family": taxa["family"].to_numpy(),
+            "genus": taxa["genus"].to_numpy(),
+            "species": np.where(rng.random(n) < 0.03, None, taxa["species"].to_numpy()),
+            "scientificName": taxa["species"].to_numpy() + " L.",
+            "countryCode": np.where(rng.random(n) < 0.01, None, country),
+            "stateProvince": rng.choice(np.array(["", "None", " North ", "South", "Central", None], dtype=object), n),
+            "locality": None,
+            "individualCount": rng.choice(np.array([1.0, 2.0, 5.0, np.nan, -1.0]), n, p=[0.5, 0.1, 0.05, 0.34, 0.01]),
+            "decimalLatitude": np.round(lat, 5),
+            "decimalLongitude": np.round(lon, 5),
+            "coordinateUncertaintyInMeters": uncertainty,
+            "eventDate": event_date,
+            "year": year,
+            "month": month,
+            "day": day,
+            "speciesKey": np.where(rng.random(n) < 0.05, np.nan, taxa["speciesKey"].to_numpy()),
+            "mediaType": rng.choice(np.array(["StillImage", "Sound", None, " "], dtype=object), n, p=[0.4, 0.05, 0.5, 0.05]),
+            "basisOfRecord": rng.choice(BASIS_OF_RECORD, n, p=BASIS_WEIGHTS),
+            "elevation": None,
+            "depth": None,
+            "typeStatus": None,
+        })
+
+
+def _event_dates(rng, year, month, day):
+    """ISO 8601 eventDate strings in the mix GBIF downloads have."""
+    # Each distinct date is formatted once
+    ordinal = (year * 13 + month) * 32 + day
+    codes, uniques = pd.factorize(ordinal)
+    u_year, u_month, u_day = uniques // (13 * 32), uniques // 32 % 13, uniques % 32
+    dates = pd.Series([f"{y:04d}-{m:02d}-{d:02d}" for y, m, d in zip(u_year, u_month, u_day)], dtype=object)
+    text = dates.to_numpy()[codes]
+
+    form = rng.choice(5, len(year), p=[0.70, 0.15, 0.05, 0.05, 0.05])
+    timestamps = form == 1
+    text[timestamps] = text[timestamps] + "T10:30:00Z"
+    months = form == 2
+    text[months] = pd.Series(text[months], dtype=object).str[:7].to_numpy()
+    intervals = form == 3
+    text[intervals] = text[intervals] + "/" + pd.Series(text[intervals], dtype=object).str[:8].to_numpy() + "28"
+    text[form == 4] = None
+    return text
+
+
+def write_raw_csv(n_rows, path, seed=0, chunk_rows=CHUNK_ROWS):
+    """Write a raw download of ``n_rows`` synthetic records to ``path``."""
+    with open(path, "w", newline="", encoding="utf-8") as out:
+        for i, chunk in enumerate(Generator(n_rows, seed).chunks(chunk_rows)):
+            chunk.to_csv(out, header=(i == 0), index=False)
+    return path
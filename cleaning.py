@@ -0,0 +1,351 @@
+"""
+Shared cleaning steps for GBIF occurrence exports.
+
+The transforms in GBIF_Data_Cleaning.py live here as chunk-level functions so
+the same checks and filters can run on a fully loaded frame or chunk by chunk
+over a raw export that does not fit in memory (see ``stream_clean``).
+"""
+
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from event_dates import parse_event_dates
+from profiling import merge_profiles, print_profile, profile_frame
+from manifest import StepRun, file_info, is_current, manifest_path, sampling_memory, sampling_settings, \
+    start_memory_sampling, step_peaks
+from rules import DEFAULT_RULES_PATH, default_rules, load_rules
+from schema_inference import column_stats, infer_schema, merge_stats, save_schema, schema_path
+
+# ===============================
+# Cleaning settings
+# ===============================
+# Columns, thresholds and tokens are declared in cleaning_rules.json
+# (see rules.py).
+
+DEFAULT_CHUNKSIZE = 250_000
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+
+# ===============================
+# Cleaning transforms
+# ===============================
+def _stopwatch(timings, memory=None):
+    # Returns lap(name), which adds the seconds since the previous lap to
+    # timings[name] and, when memory is a dict and the memory is sampled
+    # (see manifest.sampling_memory), keeps the peak memory since the
+    # previous lap in memory[name]; does nothing when both are None.
+    if memory is not None:
+        step_peaks()
+    last = [time.perf_counter()]
+
+    def lap(name):
+        now = time.perf_counter()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + now - last[0]
+        peaks = step_peaks() if memory is not None else None
+        if peaks is not None:
+            _max_memory(memory, {name: peaks})
+            now = time.perf_counter()
+        last[0] = now
+    return lap
+
+
+def clean_chunk(df, stages=None, rules=None, rejected=None, timings=None, memory=None):
+    """
+    Apply the cleaning sequence to ``df`` and return the cleaned frame.
+
+    Every step is row-local, so cleaning chunks independently and
+    concatenating the results gives the same rows as cleaning the whole
+    frame. ``rules`` defaults to cleaning_rules.json. When ``stages`` is a
+    dict, the number of rows remaining after each step is added to it;
+    when ``rejected`` is a dict, the rows each filter rule rejects are;
+    when ``timings`` is a dict, the seconds spent in each step are; when
+    ``memory`` is a dict and the memory is sampled, the peak memory of
+    each step is kept in it (see ``manifest.sampling_memory``).
+    """
+    rules = rules or default_rules()
+    lap = _stopwatch(timings, memory)
+
+    def record(stage, frame):
+        if stages is not None:
+            stages[stage] = stages.get(stage, 0) + len(frame)
+
+    # 1. Drop completely empty columns
+    df = df.drop(columns=rules.drop_columns, errors="ignore")
+    record("drop_empty_cols", df)
+    lap("drop_empty_cols")
+
+    # 2. Clean text-like columns
+    blank = {token: pd.NA for token in rules.blank_tokens}
+    for col in rules.text_columns:
+        if col in df.columns:
+            df[col] = df[col].astype(str).str.strip()
+            df[col] = df[col].replace(blank)
+
+    # 3. Handle partial missing values
+    df["countryCode"] = df["countryCode"].fillna("Unknown")
+    df["speciesKey_missing"] = df["speciesKey"].isna()
+    lap("text_columns")
+
+    # 4. Date parsing (see event_dates.py). eventDate keeps the original
+    #    text; intervals such as 2019-05-01/2019-05-03 get their first and
+    #    last day.
+    dates = parse_event_dates(df["eventDate"])
+    df["year"] = dates["year"]
+    df["month"] = dates["month"]
+    df["day"] = dates["day"]
+    df["eventDateStart"] = dates["start"]
+    df["eventDateEnd"] = dates["end"]
+    lap("event_dates")
+
+    # 5. Year, coordinate and uncertainty filters, evaluated together and
+    #    applied with a single row selection
+    df = rules.to_numeric(df)
+    df = rules.apply(df, stages, rejected)
+
+    # Year/month/day stay integers whatever rows a chunk happens to hold
+    for col in ["year", "month", "day"]:
+        df[col] = df[col].astype("Int16")
+    lap("filters")
+
+    return df
+
+
+def _add_counts(totals, counts):
+    if totals is not None:
+        for name, rows in counts.items():
+            totals[name] = totals.get(name, 0) + rows
+
+
+def _max_memory(totals, memory):
+    # Peaks are not added up: each step keeps its largest over chunks and
+    # workers
+    if totals is not None:
+        for name, peaks in memory.items():
+            step = totals.setdefault(name, {})
+            for key, mb in peaks.items():
+                if mb is not None:
+                    step[key] = max(step.get(key, mb), mb)
+
+
+# ===============================
+# Parallel mode
+# ===============================
+def _clean_shard(shard, rules=None, streaming=False, memory_sampling=None):
+    # Runs in a worker process. Streamed chunks are also profiled and
+    # summarised for the output schema. memory_sampling holds the sampling
+    # settings of the process that started the worker, if it samples.
+    if memory_sampling is not None:
+        start_memory_sampling(**memory_sampling)
+    result = {"stages": {}, "rejected": {}, "timings": {}, "memory": {}}
+    lap = _stopwatch(result["timings"], result["memory"])
+    if streaming:
+        result["profile"] = profile_frame(shard, rules)
+        lap("profile")
+    result["cleaned"] = clean_chunk(shard, result["stages"], rules, result["rejected"], result["timings"],
+                                    result["memory"])
+    lap = _stopwatch(result["timings"], result["memory"])
+    if streaming:
+        result["stats"] = column_stats(result["cleaned"])
+        lap("column_stats")
+    return result
+
+
+def parallel_clean(df, stages=None, workers=DEFAULT_WORKERS, rules=None, rejected=None, timings=None,
+                   memory=None):
+    """
+    ``clean_chunk`` on a process pool.
+
+    ``df`` is split into one contiguous row range per worker; the cleaned
+    shards are concatenated in their original order, so the result is the
+    same frame (rows, order and index) as ``clean_chunk(df)``.
+    """
+    if workers <= 1 or len(df) < 2 * workers:
+        return clean_chunk(df, stages, rules, rejected, timings, memory)
+
+    bounds = [len(df) * i // workers for i in range(workers + 1)]
+    shards = [df.iloc[start:stop] for start, stop in zip(bounds, bounds[1:])]
+
+    with ProcessPoolExecutor(workers) as pool:
+        sampling = sampling_settings() if memory is not None else None
+        results = list(pool.map(_clean_shard, shards, [rules] * len(shards), [False] * len(shards),
+                                [sampling] * len(shards)))
+
+    for result in results:
+        _add_counts(stages, result["stages"])
+        _add_counts(rejected, result["rejected"])
+        _add_counts(timings, result["timings"])
+        _max_memory(memory, result["memory"])
+    return pd.concat([result["cleaned"] for result in results])
+
+
+# ===============================
+# Streaming mode
+# ===============================
+def iter_raw_chunks(raw_path, chunksize=DEFAULT_CHUNKSIZE):
+    # Raw columns are read as text so every chunk has the same dtypes;
+    # only the columns the cleaning steps validate are converted.
+    return pd.read_csv(raw_path, chunksize=chunksize, dtype=str)
+
+
+def _clean_chunks(chunks, workers, rules=None):
+    """
+    Yield the ``_clean_shard`` result of each raw chunk, in input order.
+    With several workers, at most ``2 * workers`` chunks are read ahead of
+    the writer.
+    """
+    if workers <= 1:
+        for chunk in chunks:
+            yield _clean_shard(chunk, rules, streaming=True)
+        return
+
+    sampling = sampling_settings()
+
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(_clean_shard, chunk, rules, True, sampling))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def stream_clean(raw_path, clean_path, chunksize=DEFAULT_CHUNKSIZE, workers=1, rules=None):
+    """
+    Clean ``raw_path`` chunk by chunk and append the result to ``clean_path``.
+
+    With ``workers`` > 1 the chunks are profiled and cleaned on a process
+    pool and written in input order. Memory stays bounded by a few chunks
+    per worker. Returns a report holding the merged data-quality profile of
+    the raw data (see ``profiling``), the rows remaining after each
+    cleaning stage, the rows rejected by each filter rule, the seconds
+    spent in each step (summed over chunks, and over workers when there are
+    several), the peak memory of each step when it is sampled (the largest
+    over chunks and workers, see ``manifest.sampling_memory``) and the
+    inferred output schema.
+
+    The schema (see ``schema_inference``) is only known once every chunk has
+    been seen, so the CSV keeps all columns; it is saved next to the CSV and
+    the later steps leave the dropped columns out.
+    """
+    profile = merge_profiles([])
+    stats = {}
+    rows_out = 0
+    stages = {}
+    rejected = {}
+    timings = {}
+    memory = {}
+
+    with open(clean_path, "w", newline="", encoding="utf-8") as out:
+        results = _clean_chunks(iter_raw_chunks(raw_path, chunksize), workers, rules)
+        for i, result in enumerate(results):
+            profile = merge_profiles([profile, result["profile"]])
+            stats = merge_stats([stats, result["stats"]])
+            _add_counts(stages, result["stages"])
+            _add_counts(rejected, result["rejected"])
+            _add_counts(timings, result["timings"])
+            _max_memory(memory, result["memory"])
+
+            lap = _stopwatch(timings, memory)
+            result["cleaned"].to_csv(out, header=(i == 0), index=False)
+            rows_out += len(result["cleaned"])
+            lap("write")
+
+    schema = infer_schema(stats, rules)
+    save_schema(schema, schema_path(clean_path))
+
+    return {
+        "profile": profile,
+        "rows_out": rows_out,
+        "stages": stages,
+        "rejected": rejected,
+        "timings": {step: round(seconds, 3) for step, seconds in timings.items()},
+        "memory": memory,
+        "schema": schema,
+    }
+
+
+def run_cleaning(raw_path, clean_path, chunksize=DEFAULT_CHUNKSIZE, workers=1,
+                 rules_path=DEFAULT_RULES_PATH, force=False, trace_memory=False):
+    """
+    ``stream_clean`` with a run manifest (see manifest.py).
+
+    The hashes of the raw file and the rules file, the rows after each
+    stage, the time and peak memory of the run and of each cleaning step
+    and the outputs are recorded under ``"clean"`` in the manifest next to
+    ``clean_path``. ``trace_memory`` also traces the memory each step
+    allocates with tracemalloc, which makes the cleaning several times
+    slower. If that manifest shows the same inputs and the outputs are
+    unchanged, the cleaning is skipped and ``None`` is returned (unless
+    ``force``).
+    """
+    inputs = {"raw": file_info(raw_path), "rules": file_info(rules_path)}
+    path = manifest_path(clean_path)
+    if not force and is_current(path, "clean", inputs):
+        return None
+
+    run = StepRun("clean", inputs, {"chunksize": chunksize, "workers": workers, "trace_memory": trace_memory})
+    with run.stage("stream_clean"), sampling_memory(trace_memory):
+        report = stream_clean(raw_path, clean_path, chunksize, workers, load_rules(rules_path))
+    run.record["rows"] = {"raw": report["profile"]["rows"], **report["stages"], "written": report["rows_out"]}
+    run.finish(
+        {"cleaned": clean_path, "schema": schema_path(clean_path)},
+        step_seconds=report["timings"],
+        step_memory=report["memory"],
+        rejected=report["rejected"],
+        checks=report["profile"]["checks"],
+        schema=report["schema"],
+    )
+    run.save(path)
+    return report
+
+
+def print_report(report):
+    print_profile(report["profile"])
+
+    print("\n==============================")
+    print("ROWS AFTER EACH STAGE")
+    print("==============================")
+    for stage, count in report["stages"].items():
+        print(f"{stage}:", count)
+    print("Rows written:", report["rows_out"])
+
+    print("\n==============================")
+    print("SECONDS PER STEP")
+    print("==============================")
+    for step, seconds in report["timings"].items():
+        print(f"{step}:", seconds)
+
+    if report["memory"]:
+        print("\n==============================")
+        print("PEAK MEMORY PER STEP (MB)")
+        print("==============================")
+        for step, peaks in report["memory"].items():
+            traced = f", {peaks['traced_peak_mb']} traced" if "traced_peak_mb" in peaks else ""
+            print(f"{step}:", f"{peaks.get('peak_memory_mb')} resident{traced}")
+
+    print_rejected(report["rejected"])
+    print_schema(report["schema"])
+
+
+def print_rejected(rejected):
+    print("\n==============================")
+    print("ROWS REJECTED BY EACH RULE")
+    print("==============================")
+    for rule, count in rejected.items():
+        print(f"{rule}:", count)
+
+
+def print_schema(schema):
+    print("\n==============================")
+    print("OUTPUT SCHEMA")
+    print("==============================")
+    print("Dropped (empty or nearly empty):", schema["dropped"])
+    for column in schema["columns"]:
+        print(f"{column['name']}:", column["type"])
@@ -1,22 +1,237 @@
-import pandas as pd
-
-def convert_csv_to_parquet():
-    print("Loading CSV...")
-    df = pd.read_csv("gbif_cleaned.csv")
-    
-    print("Processing dates...")
-    df["eventDate"] = pd.to_datetime(df["eventDate"], errors="coerce")
-    df["year"] = df["eventDate"].dt.year
-    df["month"] = df["eventDate"].dt.month
-    
-    print("Optimizing data types...")
-    # Convert object columns to category for massive memory savings
-    for col in df.select_dtypes(include=["object"]).columns:
-        df[col] = df[col].astype("category")
-        
-    print("Saving to Parquet...")
-    df.to_parquet("gbif_cleaned.parquet", index=False)
-    print("Done! Saved as gbif_cleaned.parquet")
+import csv
+import json
+import os
+import shutil
+
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.dataset as ds
+
+# ===============================
+# GBIF column schema
+# ===============================
+# Fixed types for the cleaned GBIF columns. Taxonomy and other repetitive
+# text columns are dictionary-encoded; columns not listed here are kept
+# as plain strings.
+DICT_STRING = pa.dictionary(pa.int32(), pa.string())
+
+GBIF_SCHEMA = pa.schema([
+    ("gbifID", pa.int64()),
+    ("occurrenceID", pa.string()),
+    ("kingdom", DICT_STRING),
+    ("phylum", DICT_STRING),
+    ("class", DICT_STRING),
+    ("order", DICT_STRING),
+    ("family", DICT_STRING),
+    ("genus", DICT_STRING),
+    ("species", DICT_STRING),
+    ("scientificName", pa.string()),
+    ("countryCode", DICT_STRING),
+    ("stateProvince", DICT_STRING),
+    ("decimalLatitude", pa.float32()),
+    ("decimalLongitude", pa.float32()),
+    ("coordinateUncertaintyInMeters", pa.float32()),
+    ("eventDate", pa.string()),
+    ("eventDateStart", pa.date32()),
+    ("eventDateEnd", pa.date32()),
+    ("year", pa.int16()),
+    ("month", pa.int8()),
+    ("day", pa.int8()),
+    ("speciesKey", pa.int64()),
+    ("speciesKey_missing", pa.bool_()),
+    ("basisOfRecord", DICT_STRING),
+    ("mediaType", DICT_STRING),
+])
+
+PARTITION_COLUMNS = ["year", "kingdom"]
+
+# Type names used in the .schema.json files (see schema_inference.py)
+TYPE_NAMES = {
+    "bool": pa.bool_(),
+    "int8": pa.int8(),
+    "int16": pa.int16(),
+    "int32": pa.int32(),
+    "int64": pa.int64(),
+    "float32": pa.float32(),
+    "float64": pa.float64(),
+    "string": pa.string(),
+    "dictionary": DICT_STRING,
+    "date32": pa.date32(),
+}
+
+CSV_BLOCK_SIZE = 64 << 20  # bytes of CSV parsed per batch
+ROWS_PER_GROUP = 256_000
+
+
+def _read_type(field_type):
+    # Integer columns may have been written as floats ("2019.0") by pandas,
+    # so they are parsed as float64 and cast to the narrow type afterwards.
+    if pa.types.is_integer(field_type):
+        return pa.float64()
+    return field_type
+
+
+def target_schema(columns):
+    """Schema for a CSV with ``columns``: GBIF types, strings for the rest."""
+    fields = []
+    for col in columns:
+        idx = GBIF_SCHEMA.get_field_index(col)
+        fields.append(GBIF_SCHEMA.field(idx) if idx >= 0 else pa.field(col, pa.string()))
+    return pa.schema(fields)
+
+
+def type_name(field_type):
+    return next(name for name, t in TYPE_NAMES.items() if t == field_type)
+
+
+def schema_from_json(path):
+    """Arrow schema of the columns kept in a .schema.json file, or None if it does not exist."""
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        columns = json.load(f)["columns"]
+    return pa.schema([(c["name"], TYPE_NAMES[c["type"]]) for c in columns])
+
+
+def _csv_header(csv_path):
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        return next(csv.reader(f))
+
+
+def iter_csv_batches(csv_path, schema):
+    """Stream ``csv_path`` as record batches conforming to ``schema``."""
+    convert_options = pv.ConvertOptions(
+        column_types={f.name: _read_type(f.type) for f in schema},
+        include_columns=schema.names,
+        strings_can_be_null=True,
+    )
+    reader = pv.open_csv(
+        csv_path,
+        read_options=pv.ReadOptions(block_size=CSV_BLOCK_SIZE),
+        convert_options=convert_options,
+    )
+    for batch in reader:
+        yield pa.Table.from_batches([batch]).cast(schema).to_batches()[0]
+
+
+def _partitioning(schema, partition_by):
+    field = schema.field(partition_by)
+    # Partition directories hold plain values, not dictionary indices
+    if pa.types.is_dictionary(field.type):
+        field = pa.field(partition_by, field.type.value_type)
+    return ds.partitioning(pa.schema([field]), flavor="hive")
+
+
+def write_dataset(batches, schema, out_path, partition_by="year", basename_template=None,
+                  existing_data_behavior="error"):
+    """Write ``batches`` as a hive-partitioned Parquet dataset at ``out_path``."""
+    partitioning = _partitioning(schema, partition_by)
+    part_type = partitioning.schema.field(partition_by).type
+    if part_type != schema.field(partition_by).type:
+        schema = schema.set(schema.get_field_index(partition_by), pa.field(partition_by, part_type))
+        batches = (
+            batch.set_column(
+                batch.schema.get_field_index(partition_by),
+                partition_by,
+                batch.column(partition_by).cast(part_type),
+            )
+            for batch in batches
+        )
+
+    file_format = ds.ParquetFileFormat()
+    ds.write_dataset(
+        batches,
+        out_path,
+        schema=schema,
+        format=file_format,
+        file_options=file_format.make_write_options(compression="zstd", write_statistics=True),
+        partitioning=partitioning,
+        basename_template=basename_template,
+        max_rows_per_group=ROWS_PER_GROUP,
+        min_rows_per_group=ROWS_PER_GROUP // 4,
+        existing_data_behavior=existing_data_behavior,
+    )
+
+
+def convert_csv_to_parquet(csv_path="gbif_cleaned.csv", out_path="gbif_cleaned.parquet",
+                           partition_by="year"):
+    if partition_by not in PARTITION_COLUMNS:
+        raise ValueError(f"partition_by must be one of {PARTITION_COLUMNS}")
+
+    # The schema written by the cleaning step leaves out empty columns and
+    # narrows numeric types; without it every CSV column is converted.
+    schema_file = os.path.splitext(csv_path)[0] + ".schema.json"
+    schema = schema_from_json(schema_file)
+    if schema is not None:
+        print(f"Using column schema {schema_file}")
+    else:
+        print("Reading CSV header...")
+        schema = target_schema(_csv_header(csv_path))
+
+    print(f"Streaming CSV into a Parquet dataset partitioned by {partition_by}...")
+    # Written next to the target first so an interrupted run never leaves
+    # a half-written dataset in place of the old one.
+    tmp_path = out_path + ".tmp"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    write_dataset(iter_csv_batches(csv_path, schema), schema, tmp_path, partition_by)
+
+    if os.path.isdir(out_path):
+        shutil.rmtree(out_path)
+    elif os.path.exists(out_path):
+        os.remove(out_path)
+    os.replace(tmp_path, out_path)
+    print(f"Done! Saved as {out_path}")
+
 
 if __name__ == "__main__":
-    convert_csv_to_parquet()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert gbif_cleaned.csv to a partitioned Parquet dataset")
+    parser.add_argument("--csv", default="gbif_cleaned.csv")
+    parser.add_argument("--out", default="gbif_cleaned.parquet")
+    parser.add_argument("--partition-by", default="year", choices=PARTITION_COLUMNS)
+    parser.add_argument("--force", action="store_true",
+                        help="convert even if the CSV is unchanged since the last conversion")
+    args = parser.parse_args()
+
+    from cube import CUBE_PATH, build_cube
+    from manifest import StepRun, file_info, is_current, manifest_path
+    from warm_start import write_warm_start
+
+    # The conversion is recorded next to the cleaning run in the dataset's
+    # manifest (input hashes, time and memory of each stage, outputs), and
+    # skipped when the CSV and its schema are the ones converted last time.
+    inputs = {"csv": file_info(args.csv)}
+    schema_file = os.path.splitext(args.csv)[0] + ".schema.json"
+    if os.path.exists(schema_file):
+        inputs["schema"] = file_info(schema_file)
+    settings = {"partition_by": args.partition_by}
+    path = manifest_path(args.out)
+
+    if not args.force and is_current(path, "convert", inputs, settings):
+        print(f"{args.csv} unchanged since the last conversion, skipping (use --force to convert again)")
+    else:
+        run = StepRun("convert", inputs, settings)
+        with run.stage("convert"):
+            convert_csv_to_parquet(args.csv, args.out, args.partition_by)
+
+        # The dashboard's summary, time series and taxonomy sections read the
+        # pre-aggregated cube built from the new dataset
+        print("Building occurrence cube...")
+        with run.stage("cube"):
+            cube = build_cube(args.out)
+        print(f"Done! Saved {cube.num_rows} cells as {CUBE_PATH}")
+
+        # Filter values, aggregates and map cells of the dashboard's
+        # unfiltered page, so a restarted dashboard renders it at once
+        with run.stage("warm_start"):
+            warm_path = write_warm_start(args.out, CUBE_PATH)
+        print(f"Saved the dashboard's warm-start state as {warm_path}")
+
+        run.record["rows"] = {
+            "dataset": ds.dataset(args.out, format="parquet", partitioning="hive").count_rows(),
+            "cube_cells": cube.num_rows,
+        }
+        run.finish({"dataset": args.out, "cube": CUBE_PATH, "warm_start": warm_path})
+        run.save(path)
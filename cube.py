@@ -0,0 +1,220 @@
+"""
+Pre-aggregated occurrence cube for the dashboard's summary, time series and
+taxonomy sections.
+
+The cube holds one row per (countryCode, kingdom, year, month, taxon) cell
+with the number of occurrences in it, where the taxon is the full path of
+taxonomy columns from kingdom down to species. A cell is therefore at most
+one per distinct species (or deepest known rank) and month, not one per
+rank. When the cube is loaded, the distinct paths are split into a
+separate table (``Cube.taxa``) and each cell keeps only its path id; the
+counts of a higher rank are the path counts added up through that table.
+Distinct taxon counts stay exact: they are the number of distinct values
+among the paths of the selected cells. Answering a view costs time
+proportional to the number of cells, not the number of occurrences.
+
+The cube records the version of the dataset it was built from (see
+``data_access.dataset_version``); ``load_cube`` ignores a cube that does not
+match the dataset, e.g. after the dataset was converted again without
+rebuilding it.
+
+Build it after convert_data.py with ``python cube.py``.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import data_access
+from filter_index import FilterIndex
+
+CUBE_PATH = "gbif_cube.parquet"
+
+CUBE_DIMENSIONS = ["countryCode", "kingdom", "year", "month"]
+CUBE_RANKS = data_access.TAXONOMY_COLUMNS
+TAXON_COLUMNS = [r for r in CUBE_RANKS if r not in CUBE_DIMENSIONS]
+
+CUBE_SCHEMA = pa.schema(
+    [
+        ("countryCode", pa.string()),
+        ("kingdom", pa.string()),
+        ("year", pa.int16()),
+        ("month", pa.int8()),
+    ]
+    + [(rank, pa.string()) for rank in TAXON_COLUMNS]
+    + [("count", pa.int64())]
+)
+
+# Schema metadata key of the dataset version the cube was built from
+VERSION_KEY = b"dataset_version"
+
+BATCH_ROWS = 1_000_000
+MERGE_EVERY = 16  # partial cubes kept before they are merged
+
+
+# ===============================
+# Build
+# ===============================
+def cube_from_table(table):
+    """Count the occurrences of ``table`` per cube cell."""
+    keys = CUBE_DIMENSIONS + TAXON_COLUMNS
+    table = table.select(keys).cast(pa.schema([CUBE_SCHEMA.field(col) for col in keys]))
+    counts = table.group_by(keys).aggregate([([], "count_all")])
+    return counts.rename_columns(keys + ["count"]).select(CUBE_SCHEMA.names)
+
+
+def merge_cubes(cubes):
+    """Add up the counts of cubes built from disjoint sets of occurrences."""
+    table = pa.concat_tables(cubes)
+    keys = [col for col in CUBE_SCHEMA.names if col != "count"]
+    merged = table.group_by(keys).aggregate([("count", "sum")])
+    return merged.rename_columns(keys + ["count"]).select(CUBE_SCHEMA.names)
+
+
+def build_cube(data_path=data_access.DATA_PATH, cube_path=CUBE_PATH):
+    """Aggregate the occurrence dataset batch by batch and write the cube."""
+    data_version = data_access.dataset_version(data_path)
+    dataset = data_access.open_dataset(data_path)
+    columns = CUBE_DIMENSIONS + TAXON_COLUMNS
+
+    cube = None
+    partials = []
+    for batch in dataset.to_batches(columns=columns, batch_size=BATCH_ROWS):
+        partials.append(cube_from_table(pa.Table.from_batches([batch])))
+        if len(partials) >= MERGE_EVERY:
+            cube = merge_cubes(([cube] if cube is not None else []) + partials)
+            partials = []
+    if partials:
+        cube = merge_cubes(([cube] if cube is not None else []) + partials)
+    if cube is None:
+        cube = CUBE_SCHEMA.empty_table()
+    return write_cube(cube, cube_path, data_version)
+
+
+def write_cube(cube, cube_path=CUBE_PATH, data_version=None):
+    """Write the cube, recording the ``data_version`` it was built from."""
+    cube = cube.sort_by([(col, "ascending") for col in CUBE_DIMENSIONS + TAXON_COLUMNS])
+    cube = cube.replace_schema_metadata({VERSION_KEY: json.dumps(data_version)})
+    pq.write_table(cube, cube_path, compression="zstd")
+    return cube
+
+
+def read_cube(cube_path=CUBE_PATH):
+    """The cells of the cube at ``cube_path``, to add new cells to."""
+    if pq.read_schema(cube_path).names != CUBE_SCHEMA.names:
+        raise ValueError(f"{cube_path} has an older layout; rebuild it with python cube.py")
+    return pq.read_table(cube_path, schema=CUBE_SCHEMA)
+
+
+def cube_version(cube_path=CUBE_PATH):
+    """The dataset version recorded in the cube, or ``None``."""
+    metadata = pq.read_schema(cube_path).metadata or {}
+    if VERSION_KEY not in metadata:
+        return None
+    version = json.loads(metadata[VERSION_KEY])
+    return tuple(version) if version is not None else None
+
+
+# ===============================
+# Query
+# ===============================
+def load_cube(cube_path=CUBE_PATH, data_path=data_access.DATA_PATH):
+    """
+    The cube at ``cube_path``, or ``None`` if it has not been built, was
+    built from another version of the dataset at ``data_path``, or with an
+    older layout (rebuild it with ``python cube.py``).
+    """
+    if not os.path.exists(cube_path):
+        return None
+    if pq.read_schema(cube_path).names != CUBE_SCHEMA.names:
+        return None
+    if cube_version(cube_path) != data_access.dataset_version(data_path):
+        return None
+    table = pq.read_table(cube_path, read_dictionary=CUBE_RANKS)
+    return Cube(table.to_pandas())
+
+
+class Cube:
+    """Answers the dashboard aggregates from the cube cells."""
+
+    def __init__(self, cells):
+        # One id per distinct taxonomy path; ``taxa`` maps each path to the
+        # codes of its taxa, rank by rank (-1 for a missing rank)
+        path = cells.groupby(CUBE_RANKS, dropna=False, sort=False, observed=True).ngroup().to_numpy()
+        _, first = np.unique(path, return_index=True)
+        paths = cells[CUBE_RANKS].iloc[first]
+        self.taxa = {rank: pd.factorize(paths[rank].to_numpy()) for rank in CUBE_RANKS}
+        self.n_paths = len(first)
+
+        self.cells = cells[CUBE_DIMENSIONS + ["count"]].assign(path=path)
+        self.index = FilterIndex(self.cells, columns=("countryCode", "kingdom", "year"), lowercase=())
+
+    def select(self, countryCode=None, kingdom=None, year=None):
+        """Cells matching the filters; ``None`` leaves a dimension unrestricted."""
+        return CubeView(self, dict(countryCode=countryCode, kingdom=kingdom, year=year))
+
+
+class CubeView:
+    """
+    The cube restricted to one filter state. Its methods mirror the
+    functions in aggregates.py.
+    """
+
+    def __init__(self, cube, selections):
+        self.cube = cube
+        self.selections = selections
+        self._path_counts = None
+
+    def _cells(self):
+        rows = self.cube.index.resolve(**self.selections)
+        return self.cube.cells if rows is None else self.cube.cells.take(rows)
+
+    def path_counts(self):
+        """Occurrences per taxonomy path among the selected cells."""
+        if self._path_counts is None:
+            cells = self._cells()
+            counts = np.bincount(cells["path"].to_numpy(), weights=cells["count"].to_numpy(),
+                                 minlength=self.cube.n_paths)
+            self._path_counts = counts.astype(np.int64)
+        return self._path_counts
+
+    def _distinct(self, rank):
+        codes, _ = self.cube.taxa[rank]
+        present = codes[(self.path_counts() > 0) & (codes >= 0)]
+        return int(np.unique(present).size)
+
+    def summary_metrics(self):
+        return {
+            "records": int(self.path_counts().sum()),
+            "species": self._distinct("species"),
+            "genera": self._distinct("genus"),
+            "families": self._distinct("family"),
+        }
+
+    def yearly_counts(self):
+        cells = self._cells()
+        return cells.groupby("year")["count"].sum().reset_index(name="count")
+
+    def monthly_counts(self):
+        cells = self._cells()
+        return cells.groupby("month")["count"].sum().reset_index(name="count")
+
+    def top_values(self, col, n=10):
+        codes, values = self.cube.taxa[col]
+        # Bin 0 collects the paths with no taxon at this rank
+        counts = np.bincount(codes + 1, weights=self.path_counts(), minlength=len(values) + 1)
+        labels = np.concatenate([["Unknown"], values.astype(object)])
+        counts = pd.Series(counts.astype(np.int64), index=labels)
+        counts = counts[counts > 0].groupby(level=0).sum()
+        counts = counts.sort_values(ascending=False, kind="stable").head(n)
+        return pd.DataFrame({"value": counts.index, "count": counts.to_numpy()})
+
+
+if __name__ == "__main__":
+    print("Building occurrence cube...")
+    cube = build_cube()
+    print(f"Done! Saved {cube.num_rows} cells as {CUBE_PATH}")
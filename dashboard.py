@@ -1,20 +1,38 @@
 # ===============================================================
-# GBIF BIODIVERSITY DASHBOARD — FINAL VERSION (92,142 POINTS)
-# NO SAMPLING • FOLIUM CLUSTER • YEAR FILTER • SPECIES SEARCH
+# GBIF BIODIVERSITY DASHBOARD — FINAL VERSION
+# GRID-BINNED MAP • FOLIUM CLUSTER • YEAR FILTER • SPECIES SEARCH
 # ===============================================================
 
 import streamlit as st
 import pandas as pd
 import folium
-from folium.plugins import HeatMap, MarkerCluster
 from streamlit_folium import st_folium
 import plotly.express as px
 
+import aggregates
+import data_access
+import export
+import map_layers
+import perf
+import raster
+import spatial
+import warm_start
+from cube import CUBE_PATH, load_cube
+from filter_index import FilterIndex, intersect
+from query_cache import QueryCache
+from species_index import SpeciesIndex
+from taxonomy import TaxonomyCounts
+
 # ---------------------------------------------------------------
 # PAGE CONFIG
 # ---------------------------------------------------------------
 st.set_page_config(page_title="GBIF Dashboard", layout="wide")
 
+# ---------------- PERFORMANCE TIMING ---------------------------
+# With ?perf=1 in the URL each stage of the rerun is timed and shown in the
+# sidebar's performance panel (see perf.py); otherwise the timer is a no-op.
+timer = perf.RerunTimer(enabled=st.query_params.get("perf") == "1")
+
 # ---------------- BACKGROUND COLOR THEME -----------------------
 st.markdown("""
     <style>
@@ -33,23 +51,93 @@ st.title("🌍 GBIF Biodiversity Dashboard")
 # ---------------------------------------------------------------
 # LOAD DATA
 # ---------------------------------------------------------------
-@st.cache_data
-def load_data():
-    # Load from optimized Parquet file
+# Only the columns the views use are read (see data_access.py), from a
+# memory-mapped snapshot that every dashboard process on the host shares.
+# The data and its filter, species and spatial indexes are built once and shared by every session,
+# and rebuilt when the dataset changes on disk (e.g. after ingest.py).
+# The indexes are only needed once the filters change, so they are loaded
+# on background threads while the first page renders; the first process
+# builds each one and the others map it from shared memory.
+def shared_index(name, load, build):
+    return warm_start.BackgroundTask(
+        lambda: load(data_access.read_shared_arrays(name, lambda: build().arrays()))
+    )
+
+
+@st.cache_resource(max_entries=1)
+def load_data(data_version):
     try:
-        df = pd.read_parquet("gbif_cleaned.parquet")
+        df = data_access.read_shared_view(data_access.VIEW_COLUMNS)
     except FileNotFoundError:
         st.error("Parquet file not found. Please run convert_data.py first.")
-        return pd.DataFrame()
-    return df
+        st.stop()
+    except OSError:
+        # The shared directory cannot hold the snapshot (e.g. a small /dev/shm)
+        df = data_access.read_view(data_access.VIEW_COLUMNS)
+    lat, lon = df["decimalLatitude"], df["decimalLongitude"]
+    return (
+        df,
+        shared_index("filter_index", FilterIndex.from_arrays, lambda: FilterIndex(df, lowercase=())),
+        shared_index("species_index", SpeciesIndex.from_arrays, lambda: SpeciesIndex(df["species"])),
+        shared_index(
+            "grid_index",
+            lambda arrays: spatial.GridIndex.from_arrays(arrays, lat, lon),
+            lambda: spatial.GridIndex(lat, lon),
+        ),
+    )
+
+
+# Pre-aggregated counts for the summary, time series and taxonomy sections
+# (built by cube.py); None falls back to aggregating raw occurrences, also
+# when the cube was built from another version of the dataset.
+@st.cache_resource(max_entries=1)
+def load_occurrence_cube(data_version, cube_version):
+    return load_cube()
+
+
+# Rerun timings of every session, for the performance panel
+@st.cache_resource
+def get_perf_metrics():
+    return perf.PerfMetrics()
+
+
+# Filtered views and aggregates, keyed on the filter state and shared by
+# every session (see query_cache.py)
+@st.cache_resource(max_entries=1)
+def get_query_cache(data_version, cube_version):
+    return QueryCache()
 
-df = load_data()
+
+# Filter values and the unfiltered page's aggregates and map cells, saved
+# by convert_data.py (see warm_start.py); computed in the background and
+# saved when missing.
+@st.cache_resource(max_entries=1)
+def get_warm_start(data_version, cube_version):
+    return warm_start.WarmStart(
+        warm_start.warm_start_path(),
+        warm_start.current_version(),
+        lambda: warm_start.compute_warm_start(df, occurrence_cube),
+    )
+
+
+data_version = data_access.dataset_version()
+cube_version = data_access.dataset_version(CUBE_PATH)
+df, filter_index_task, species_index_task, grid_index_task = load_data(data_version)
+occurrence_cube = load_occurrence_cube(data_version, cube_version)
+query_cache = get_query_cache(data_version, cube_version)
+warm = get_warm_start(data_version, cube_version)
 
 # Metadata lists
-countries = sorted(df["countryCode"].dropna().unique())
-kingdoms = sorted(df["kingdom"].dropna().unique())
-years = sorted(df["year"].dropna().unique())
-species_list = sorted(df["species"].dropna().unique())
+metadata = warm.metadata
+if metadata is None:
+    metadata = {col: filter_index_task.result().values(col) for col in warm_start.METADATA_COLUMNS}
+countries = metadata["countryCode"]
+kingdoms = metadata["kingdom"]
+years = metadata["year"]
+timer.lap("load")
+
+MAP_KEY = "occurrence_map"
+MAX_INDIVIDUAL_POINTS = 100_000
 
 taxonomy_levels = {
     "Kingdom": "kingdom",
@@ -71,25 +159,89 @@ selected_country = st.sidebar.selectbox("Country", ["All"] + countries)
 selected_kingdoms = st.sidebar.multiselect("Kingdom", kingdoms, default=kingdoms)
 selected_years = st.sidebar.multiselect("Year", years, default=years)
 
-species_query = st.sidebar.text_input("🔎 Search Species (Exact Match):")
+species_query = st.sidebar.text_input("🔎 Search Species:")
+
+# Names starting with the query, then similar names (typos), from the
+# species index; the chosen one filters the data. A query nothing matches
+# selects no rows.
+species_filter = None
+if species_query.strip():
+    species_matches = species_index_task.result().search(species_query)
+    if species_matches:
+        species_filter = st.sidebar.selectbox("Matching species", species_matches)
+    else:
+        species_filter = species_query
+        st.sidebar.caption("No matching species.")
+timer.lap("sidebar")
 
 
 
 # ---------------------------------------------------------------
 # APPLY FILTERS
 # ---------------------------------------------------------------
-mask = pd.Series(True, index=df.index)
+filter_key = (
+    selected_country,
+    tuple(sorted(selected_kingdoms)),
+    tuple(sorted(selected_years)),
+    species_filter.lower() if species_filter else None,
+)
+
+
+def cached(name, compute):
+    return query_cache.get_or_compute((filter_key, name), compute)
+
 
-if selected_country != "All":
-    mask &= df["countryCode"] == selected_country
+warm.seed(query_cache, ("All", tuple(sorted(kingdoms)), tuple(sorted(years)), None))
 
-mask &= df["kingdom"].isin(selected_kingdoms)
-mask &= df["year"].isin(selected_years)
 
-if species_query:
-    mask &= df["species"].astype(object).fillna("").str.lower() == species_query.lower()
+# Selections that keep every value do not restrict anything, unless the
+# column has missing values: those rows match no selection
+@st.cache_resource(max_entries=1)
+def columns_with_missing(data_version):
+    return {col for col in ("kingdom", "year") if df[col].isna().any()}
 
-filtered_df = df[mask]
+
+def selection(col, selected, values):
+    if len(selected) == len(values) and col not in columns_with_missing(data_version):
+        return None
+    return selected
+
+
+selections = dict(
+    countryCode=None if selected_country == "All" else selected_country,
+    kingdom=selection("kingdom", selected_kingdoms, kingdoms),
+    year=selection("year", selected_years, years),
+)
+
+
+# Filters resolve to row positions through the prebuilt indexes
+def resolve_rows():
+    if species_filter is None and all(selected is None for selected in selections.values()):
+        return None
+    rows = filter_index_task.result().resolve(**selections)
+    if species_filter:
+        rows = intersect(species_index_task.result().rows(species_filter), rows)
+    return rows
+
+
+filter_rows = cached("rows", resolve_rows)
+filtered_df = cached("view", lambda: df if filter_rows is None else df.take(filter_rows))
+timer.lap("filter")
+timer.size("filtered_rows", len(filtered_df))
+
+
+def aggregate(name, *args):
+    # The cube has no species-search dimension, so a species query is
+    # answered from the filtered occurrences instead.
+    if occurrence_cube is not None and not species_filter:
+        view = occurrence_cube.select(**selections)
+        return cached((name,) + args, lambda: getattr(view, name)(*args))
+    # The taxonomy counts are cached rather than the view, so their memory
+    # counts towards the cache's cap
+    view = aggregates.FrameView(
+        filtered_df, taxonomy=lambda: cached("taxonomy", lambda: TaxonomyCounts(filtered_df))
+    )
+    return cached((name,) + args, lambda: getattr(view, name)(*args))
 
 
 # ---------------------------------------------------------------
@@ -101,14 +253,29 @@ map_col, summary_col = st.columns([2, 1])
 
 with summary_col:
     st.write("### 📊 Summary Statistics")
-    st.metric("Total Records", len(filtered_df))
-    st.metric("Unique Species", filtered_df["species"].nunique())
-    st.metric("Unique Genera", filtered_df["genus"].nunique())
-    st.metric("Unique Families", filtered_df["family"].nunique())
+    summary = aggregate("summary_metrics")
+    st.metric("Total Records", summary["records"])
+    st.metric("Unique Species", summary["species"])
+    st.metric("Unique Genera", summary["genera"])
+    st.metric("Unique Families", summary["families"])
+    timer.lap("summary_metrics")
 
     st.write("### 🗺️ Map Options")
     use_heatmap = st.checkbox("Heatmap", value=False)
     use_clusters = st.checkbox("Clusters", value=True)
+    use_raster = st.checkbox(
+        "Density raster", value=False,
+        help="Overlay a pre-rendered density image of all filtered points."
+    )
+    use_viewport = st.checkbox(
+        "Only visible area", value=False,
+        help="Send only the points inside the current map view, refreshed on pan and zoom."
+    )
+    max_map_points = st.number_input(
+        "Max map points", min_value=1000, max_value=200_000,
+        value=spatial.DEFAULT_MAX_CELLS, step=1000,
+        help="Points are binned into grid cells until at most this many are sent to the map."
+    )
 
 
 # ---------------------------------------------------------------
@@ -121,65 +288,108 @@ with map_col:
     # -----------------------------------------------------------
     # AUTO-ZOOM LOGIC
     # -----------------------------------------------------------
-    sub = filtered_df.dropna(subset=["decimalLatitude", "decimalLongitude"])
+    sub = cached("located", lambda: filtered_df.dropna(subset=["decimalLatitude", "decimalLongitude"]))
 
     if len(sub) > 0:
-        center_lat = sub["decimalLatitude"].mean()
-        center_lon = sub["decimalLongitude"].mean()
-        zoom_level = 5 if selected_country != "All" else 3
+        center_lat, center_lon = cached(
+            "map_center", lambda: (sub["decimalLatitude"].mean(), sub["decimalLongitude"].mean())
+        )
+        zoom_level = 5 if selected_country != "All" else warm_start.DEFAULT_MAP_ZOOM
     else:
         center_lat, center_lon, zoom_level = 20, 0, 2
 
-    if species_query:
+    if species_filter:
         zoom_level = 6
+    timer.lap("map_prepare")
 
     # -----------------------------------------------------------
     # CREATE FOLIUM MAP
     # -----------------------------------------------------------
-    m = folium.Map(location=[center_lat, center_lon], zoom_start=zoom_level)
-
-    map_df = sub   # ALL 92k points
+    m = folium.Map(location=[center_lat, center_lon], zoom_start=zoom_level, prefer_canvas=True)
+
+    map_df = sub
+    map_zoom = zoom_level
+    viewport = None
+
+    # ---------------- VIEWPORT MODE ----------------------------
+    # Bounds and zoom the map reported after the last pan/zoom; only the
+    # filtered points inside them are looked up in the spatial index.
+    view = st.session_state.get(MAP_KEY) or {}
+    bounds = view.get("bounds") or {}
+    if use_viewport and bounds.get("_southWest") and bounds.get("_northEast"):
+        viewport = (
+            bounds["_southWest"]["lat"], bounds["_southWest"]["lng"],
+            bounds["_northEast"]["lat"], bounds["_northEast"]["lng"],
+        )
+        visible = grid_index_task.result().query(*viewport)
+        map_df = df.take(intersect(visible, filter_rows))
+        map_zoom = view.get("zoom") or zoom_level
+        map_cells = spatial.bin_points(
+            map_df["decimalLatitude"], map_df["decimalLongitude"], map_zoom, max_map_points
+        )
+    else:
+        # Weighted grid-cell centroids instead of every point, so the payload
+        # stays under max_map_points whatever the number of records
+        map_cells = cached(
+            ("map_cells", zoom_level, max_map_points),
+            lambda: spatial.bin_points(
+                map_df["decimalLatitude"], map_df["decimalLongitude"], zoom_level, max_map_points
+            ),
+        )
+    timer.lap("map_cells")
+    timer.size("map_cells", len(map_cells))
+    timer.size("map_rows", len(map_df))
+
+    # Data layers go into a feature group that st_folium swaps in place,
+    # so the base map is not rebuilt when only the layers change
+    layer = folium.FeatureGroup(name="Occurrences")
 
     # ---------------- OPTIMIZED CLUSTERING ---------------------
     if use_clusters and len(map_df) > 0:
-        # FastMarkerCluster is much faster than adding individual markers
-        from folium.plugins import FastMarkerCluster
-        
-        # Prepare data as list of [lat, lon]
-        locations = map_df[["decimalLatitude", "decimalLongitude"]].values.tolist()
-        
-        FastMarkerCluster(data=locations).add_to(m)
-    
+        # Cluster bubbles add up the record counts of the cells they hold
+        map_layers.cluster_layer(map_cells).add_to(layer)
+
     # ---------------- INDIVIDUAL POINTS (Fallback/Non-cluster) -
-    elif not use_clusters and len(map_df) < 2000:
-         # Only render individual points if count is low to prevent crash
-        for _, row in map_df.iterrows():
-            folium.CircleMarker(
-                location=[row["decimalLatitude"], row["decimalLongitude"]],
-                radius=3,
-                color="blue",
-                fill=True,
-                fill_opacity=0.7,
-                popup=f"{row['species']}"
-            ).add_to(m)
+    elif not use_clusters and len(map_df) <= MAX_INDIVIDUAL_POINTS:
+        # One canvas-rendered GeoJSON layer for all points, popups on click;
+        # its GeoJSON is kept for reruns that leave the filters and view as
+        # they were (e.g. a new taxonomy level)
+        if len(map_df) > 0:
+            points = cached(("points", viewport), lambda: map_layers.point_collection(map_df))
+            map_layers.point_layer(points).add_to(layer)
     elif not use_clusters:
         st.warning("Too many points to display without clustering. Showing Heatmap instead.")
         use_heatmap = True
 
     # ---------------- HEATMAP OPTION ---------------------------
     if use_heatmap:
-        # Generate heat_data efficiently
-        heat_data = map_df[["decimalLatitude", "decimalLongitude"]].values.tolist()
-        HeatMap(heat_data).add_to(m)
+        map_layers.heat_layer(map_cells).add_to(layer)
+
+    # ---------------- DENSITY RASTER ---------------------------
+    # One static image for the whole filtered set, rendered once per filter
+    if use_raster and len(sub) > 0:
+        map_layers.raster_layer(cached(
+            "raster",
+            lambda: raster.render(
+                sub["decimalLatitude"], sub["decimalLongitude"],
+                height=raster.MAP_HEIGHT, extent=raster.MAP_EXTENT, mercator=True,
+            ),
+        )).add_to(layer)
+    timer.lap("map_build")
 
     # ---------------- DISPLAY MAP ------------------------------
-    # ---------------- DISPLAY MAP ------------------------------
+    # Pan/zoom only triggers a rerun in viewport mode
     st_folium(
         m,
         width=850,
         height=500,
-        key=f"map_{selected_country}_{species_query}_{selected_years}_{use_heatmap}_{use_clusters}"
+        key=MAP_KEY,
+        feature_group_to_add=layer,
+        returned_objects=["bounds", "zoom"] if use_viewport else [],
     )
+    timer.lap("st_folium")
+    # st_folium has added the layer to the map, so this is the whole payload
+    timer.size("map_html_bytes", lambda: len(m.get_root().render().encode("utf-8")))
 
 
 # ---------------------------------------------------------------
@@ -195,7 +405,7 @@ with tab1:
 
     st.write("### Yearly Observations")
 
-    yearly = filtered_df.groupby("year").size().reset_index(name="count")
+    yearly = aggregate("yearly_counts")
     fig_year = px.line(yearly, x="year", y="count", markers=True,
                        title="Yearly Observation Trend", template="plotly_white")
     fig_year.update_layout(height=350)
@@ -203,11 +413,12 @@ with tab1:
 
     st.write("### Monthly Observations")
 
-    monthly = filtered_df.groupby("month").size().reset_index(name="count")
+    monthly = aggregate("monthly_counts")
     fig_month = px.bar(monthly, x="month", y="count",
                        title="Monthly Observation Distribution", template="plotly_white")
     fig_month.update_layout(height=350)
     st.plotly_chart(fig_month, use_container_width=True)
+    timer.lap("time_series")
 
 
 # ---------------------------------------------------------------
@@ -220,16 +431,14 @@ with tab2:
     level_name = st.selectbox("Choose Level", list(taxonomy_levels.keys()))
     col_name = taxonomy_levels[level_name]
 
-    values = filtered_df[col_name].astype(object).fillna("Unknown")
-
-    top10 = values.value_counts().reset_index()
-    top10.columns = [level_name, "Count"]
-    top10 = top10.head(10)
+    top10 = aggregate("top_values", col_name)
+    top10 = top10.set_axis([level_name, "Count"], axis=1)
 
     fig_tax = px.bar(top10, x=level_name, y="Count",
                      title=f"Top 10 {level_name} Observed", template="plotly_white")
     fig_tax.update_layout(height=400, xaxis_tickangle=-40)
     st.plotly_chart(fig_tax, use_container_width=True)
+    timer.lap("taxonomy")
 
 
 # ---------------------------------------------------------------
@@ -237,11 +446,80 @@ with tab2:
 # ---------------------------------------------------------------
 st.subheader("📥 Download Filtered Dataset")
 
-st.download_button(
-    label="Download CSV",
-    data=filtered_df.to_csv(index=False),
-    file_name="filtered_gbif.csv",
-    mime="text/csv",
-    use_container_width=True,
-    key="download_filtered"
-)
+# The export is only produced when the download button is clicked: it is
+# streamed from the Parquet dataset with the current filters pushed into
+# the scan, on a thread of its own, and nothing is held between reruns.
+export_col, button_col = st.columns([2, 1])
+with export_col:
+    export_format = st.radio("Format", list(export.EXPORT_FORMATS), horizontal=True)
+
+
+def export_data():
+    species_names = None
+    if species_filter:
+        species_names = species_index_task.result().spellings(species_filter)
+    export_filter = data_access.build_filter(
+        country=selections["countryCode"],
+        kingdoms=selections["kingdom"],
+        years=selections["year"],
+        species=species_names,
+    )
+    return export.export_file(export_format, export_filter)
+
+
+with button_col:
+    extension, mime = export.EXPORT_FORMATS[export_format]
+    st.download_button(
+        label=f"Download {export_format}",
+        data=export_data,
+        file_name=f"filtered_gbif{extension}",
+        mime=mime,
+        on_click="ignore",
+        use_container_width=True,
+        key="download_filtered"
+    )
+timer.lap("download_prep")
+
+
+# ---------------------------------------------------------------
+# PERFORMANCE PANEL
+# ---------------------------------------------------------------
+# Stage times and payload sizes of this rerun, the totals of every rerun
+# timed by this process, and the totals as JSON or Prometheus metrics.
+if timer.enabled:
+    rerun = timer.record()
+    perf_metrics = get_perf_metrics()
+    perf_metrics.add(rerun)
+    totals = perf_metrics.snapshot()
+
+    with st.sidebar.expander("⏱️ Performance", expanded=True):
+        st.metric("This rerun", f"{rerun['total_seconds'] * 1000:.0f} ms")
+        st.dataframe(
+            pd.DataFrame({
+                "Stage": list(rerun["stages"]),
+                "ms": [round(s * 1000, 1) for s in rerun["stages"].values()],
+            }),
+            hide_index=True, use_container_width=True,
+        )
+        st.dataframe(
+            pd.DataFrame({"Payload": list(rerun["sizes"]), "Size": list(rerun["sizes"].values())}),
+            hide_index=True, use_container_width=True,
+        )
+
+        st.caption(f"{totals['reruns']} reruns timed by this process")
+        st.dataframe(
+            pd.DataFrame({
+                "Stage": list(totals["stages"]),
+                "Mean ms": [round(t["mean_seconds"] * 1000, 1) for t in totals["stages"].values()],
+                "Max ms": [round(t["max_seconds"] * 1000, 1) for t in totals["stages"].values()],
+            }),
+            hide_index=True, use_container_width=True,
+        )
+        st.download_button(
+            "Metrics (JSON)", perf_metrics.to_json(),
+            file_name="dashboard_metrics.json", mime="application/json",
+        )
+        st.download_button(
+            "Metrics (Prometheus)", perf_metrics.to_prometheus(),
+            file_name="dashboard_metrics.prom", mime="text/plain",
+        )
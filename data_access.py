@@ -0,0 +1,211 @@
+"""
+Data access for the dashboard.
+
+Reads go through a pyarrow dataset over ``gbif_cleaned.parquet`` (a single
+file or the partitioned dataset written by convert_data.py). Only the
+requested columns are read, and the sidebar filters are pushed into the
+scan so partitions and row groups that cannot match are skipped.
+
+``read_shared_view`` keeps the dashboard's view as an uncompressed Arrow
+IPC file in shared memory (``/dev/shm``) and memory-maps it, so every
+session and every dashboard process on the host reads the same pages.
+``read_shared_arrays`` does the same for the arrays of the dashboard's
+indexes.
+"""
+
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from convert_data import GBIF_SCHEMA, PARTITION_COLUMNS
+from snapshots import SNAPSHOT_DIR, _remove_stale, read_arrays, write_arrays
+
+DATA_PATH = "gbif_cleaned.parquet"
+
+# Schema of the whole dataset, written by ingest.py when a download needs
+# wider column types than the files already there; the scan casts the
+# older files to it. Names starting with "_" are not read as data files.
+COMMON_METADATA = "_common_metadata"
+
+# RAM-backed where available; elsewhere the snapshot is an ordinary file,
+# whose mapped pages the OS page cache still shares between processes
+SHARED_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else SNAPSHOT_DIR
+
+# Columns the dashboard views use
+FILTER_COLUMNS = ["countryCode", "kingdom", "year", "species"]
+TAXONOMY_COLUMNS = ["kingdom", "phylum", "class", "order", "family", "genus", "species"]
+VIEW_COLUMNS = ["countryCode"] + TAXONOMY_COLUMNS + [
+    "year", "month", "decimalLatitude", "decimalLongitude",
+]
+
+
+def _partitioning(path):
+    # Partition columns are recognised from the hive directory names
+    # (``year=2019``) and typed from the GBIF schema.
+    for name in sorted(os.listdir(path)):
+        key = name.split("=", 1)[0]
+        if key in PARTITION_COLUMNS and os.path.isdir(os.path.join(path, name)):
+            field = GBIF_SCHEMA.field(key)
+            if pa.types.is_dictionary(field.type):
+                field = pa.field(key, field.type.value_type)
+            return ds.partitioning(pa.schema([field]), flavor="hive")
+    return None
+
+
+def partition_column(path=DATA_PATH):
+    """Name of the hive partition column of the dataset at ``path``, if any."""
+    partitioning = _partitioning(path) if os.path.isdir(path) else None
+    return partitioning.schema.names[0] if partitioning is not None else None
+
+
+def dataset_version(path=DATA_PATH):
+    """Changes whenever a file of the dataset is added, removed or rewritten."""
+    if not os.path.exists(path):
+        return None
+    files = [path]
+    if os.path.isdir(path):
+        files = [os.path.join(root, name) for root, _, names in os.walk(path) for name in names]
+    stats = [os.stat(f) for f in files]
+    return len(stats), max((st.st_mtime_ns for st in stats), default=0), sum(st.st_size for st in stats)
+
+
+def open_dataset(path=DATA_PATH):
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    partitioning = _partitioning(path) if os.path.isdir(path) else None
+    schema = None
+    if os.path.isdir(path) and os.path.exists(os.path.join(path, COMMON_METADATA)):
+        schema = pq.read_schema(os.path.join(path, COMMON_METADATA))
+    return ds.dataset(path, format="parquet", partitioning=partitioning, schema=schema)
+
+
+def build_filter(country=None, kingdoms=None, years=None, species=None):
+    """
+    Combine the sidebar selections into a dataset filter expression.
+
+    ``None`` means "no restriction" for that field; an empty list matches
+    nothing, as with ``isin`` on a DataFrame.
+    """
+    conditions = []
+    if country is not None:
+        conditions.append(ds.field("countryCode") == country)
+    if kingdoms is not None:
+        conditions.append(ds.field("kingdom").isin(list(kingdoms)))
+    if years is not None:
+        conditions.append(ds.field("year").isin([int(y) for y in years]))
+    if species is not None:
+        conditions.append(ds.field("species").isin(list(species)))
+
+    if not conditions:
+        return None
+    expression = conditions[0]
+    for condition in conditions[1:]:
+        expression = expression & condition
+    return expression
+
+
+def read_table(columns, filter=None, path=DATA_PATH):
+    dataset = open_dataset(path)
+    columns = [c for c in columns if c in dataset.schema.names]
+    return dataset.to_table(columns=columns, filter=filter)
+
+
+def read_view(columns=VIEW_COLUMNS, filter=None, path=DATA_PATH):
+    """Read ``columns`` of the rows matching ``filter`` into a DataFrame."""
+    return read_table(columns, filter, path).to_pandas()
+
+
+def _shared_path(kind, key, path, shared_dir):
+    tag = hashlib.md5(repr((os.path.abspath(path), key)).encode("utf-8")).hexdigest()[:8]
+    version = "-".join(str(v) for v in dataset_version(path))
+    return os.path.join(shared_dir, f"gbif_{kind}.{tag}.{version}.arrow")
+
+
+def shared_view_path(columns=VIEW_COLUMNS, path=DATA_PATH, shared_dir=SHARED_DIR):
+    """Snapshot file of ``columns`` of the current version of the dataset."""
+    return _shared_path("view", list(columns), path, shared_dir)
+
+
+def _view_arrays(table):
+    # Dictionary columns become the codes (-1 for missing, in the width
+    # pandas uses) and categories of a Categorical, so they can be used as
+    # they are stored; integer columns with missing values become floats,
+    # as in to_pandas
+    arrays = {}
+    for name in table.column_names:
+        column = table[name]
+        if pa.types.is_dictionary(column.type):
+            values = column.to_pandas().array
+            arrays[f"{name}.codes"] = values.codes
+            arrays[f"{name}.categories"] = np.asarray(values.categories, dtype=object)
+        else:
+            arrays[name] = column.to_numpy()
+    return arrays
+
+
+def _view_frame(arrays):
+    columns = {}
+    for name, values in arrays.items():
+        if name.endswith(".codes"):
+            name = name[:-len(".codes")]
+            dtype = pd.CategoricalDtype(arrays[f"{name}.categories"])
+            values = pd.Categorical.from_codes(values, dtype=dtype, validate=False)
+            columns[name] = pd.Series(values, copy=False)
+        elif not name.endswith(".categories"):
+            columns[name] = values
+    return pd.DataFrame(columns, copy=False)
+
+
+def read_shared_view(columns=VIEW_COLUMNS, path=DATA_PATH, shared_dir=SHARED_DIR):
+    """
+    ``read_view(columns)`` backed by a memory-mapped snapshot.
+
+    The first process to load a version of the dataset writes the snapshot
+    and removes those of older versions; every load then maps it. Every
+    column uses the mapped pages without conversion (text columns through
+    their categorical codes), so the resident memory the view takes is
+    shared rather than held once per process.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    snap_path = shared_view_path(columns, path, shared_dir)
+    if not os.path.exists(snap_path):
+        arrays = _view_arrays(read_table(columns, path=path))
+        _remove_stale(snap_path)
+        write_arrays(arrays, snap_path)
+    return _view_frame(read_arrays(snap_path))
+
+
+def read_shared_arrays(name, build, path=DATA_PATH, shared_dir=SHARED_DIR):
+    """
+    The named arrays ``build()`` returns for the current version of the
+    dataset (e.g. an index over the view), kept in shared memory like the
+    view: the first process builds and writes them, and the others use the
+    mapped pages. If the shared directory cannot hold them (e.g. a full
+    ``/dev/shm``), the built arrays are returned unshared.
+    """
+    snap_path = _shared_path(name, None, path, shared_dir)
+    if not os.path.exists(snap_path):
+        arrays = build()
+        _remove_stale(snap_path)
+        try:
+            write_arrays(arrays, snap_path)
+        except OSError:
+            return arrays
+    return read_arrays(snap_path)
+
+
+def distinct_values(columns, path=DATA_PATH):
+    """Sorted non-null distinct values of each column, from one projected scan."""
+    table = read_table(columns, path=path)
+    values = {}
+    for col in table.column_names:
+        unique = pc.unique(table[col]).to_pylist()
+        values[col] = sorted(v for v in unique if v is not None)
+    return values
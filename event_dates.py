@@ -0,0 +1,185 @@
+"""
+Parser for GBIF ``eventDate`` values.
+
+Recognises the ISO 8601 shapes found in GBIF exports: ``YYYY``, ``YYYY-MM``,
+``YYYY-MM-DD``, each optionally followed by a time and UTC offset
+(``2019-05-01T10:00:00Z``, ``2019-05-01 10:00``), and intervals of them
+(``2019-05-01/2019-05-03``, ``2019-05-01/03``, ``2019-05/06``, ``2019/2020``).
+Times and offsets are accepted but not used; the date is taken as written.
+
+Each value becomes the first and last day it covers (``start``/``end``) and
+its ``year``/``month``/``day``: the year of the start, and the month and day
+only when the value pins them down (so ``2019`` has no month and
+``2019-05-01/2019-05-03`` no day).
+
+Other shapes, such as the ISO basic format (``20190501``), week or ordinal
+dates, are not recognised and give missing values (``NaT``).
+
+The date part of each value with a time is extracted with one anchored
+Arrow regex (the general time-stripping regex only runs on the few values
+it does not fit, such as intervals with times), and the date strings are factorized before
+they are parsed: all timestamps of one day share a single entry, so the
+per-row work is one regex match and one hash of a short string. Each
+distinct date is then parsed once, with one regular expression over all of
+them. Results are memoized across calls, so dates repeated across chunks
+are only parsed the first time.
+"""
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Times and UTC offsets, removed before the dates are matched
+_TIME = r"[T ]\d{1,2}:\d{2}(?::\d{2}(?:[.,]\d+)?)?(?:Z|[+-]\d{2}(?::?\d{2})?)?"
+
+# A date (or interval of dates) with an optional time: nearly every value
+_DATE_TIME = r"^(?P<date>[\d/-]+)(?:" + _TIME + r")?$"
+
+_PATTERN = (
+    r"^(?P<y>\d{4})(?:-(?P<m>\d{1,2})(?:-(?P<d>\d{1,2}))?)?"
+    r"(?:/(?:(?P<ey>\d{4})(?:-(?P<em>\d{1,2})(?:-(?P<ed>\d{1,2}))?)?"
+    r"|(?P<a>\d{1,2})(?:-(?P<b>\d{1,2}))?))?$"
+)
+
+COLUMNS = ["year", "month", "day", "start", "end"]
+
+DATE_UNIT = "datetime64[s]"
+
+MAX_CACHE_ENTRIES = 1_000_000
+
+
+def _int(parts, name):
+    # Groups that took no part in the match are empty strings
+    field = pc.struct_field(parts, name)
+    field = pc.if_else(pc.equal(field, ""), pa.scalar(None, pa.string()), field)
+    return pc.cast(field, pa.float64()).to_numpy(zero_copy_only=False)
+
+
+def _month(year, month):
+    return ((year - 1970) * 12 + (month - 1)).astype(np.int64).astype("datetime64[M]")
+
+
+def _days_in_month(year, month):
+    first = _month(year, month)
+    return ((first + 1).astype("datetime64[D]") - first.astype("datetime64[D]")).astype(np.int64)
+
+
+def _arrow_strings(values):
+    values = pa.array(values, type=pa.string(), from_pandas=True)
+    if isinstance(values, pa.ChunkedArray):
+        values = values.combine_chunks()
+    return values
+
+
+def _date_strings(values):
+    """Trimmed ``values`` without their times, as an Arrow string array."""
+    values = pc.utf8_trim_whitespace(_arrow_strings(values))
+    timed = pc.or_(pc.match_substring(values, "T"), pc.match_substring(values, " ")).fill_null(False)
+    if not pc.any(timed).as_py():
+        return values
+    with_times = pc.filter(values, timed)
+    dates = pc.struct_field(pc.extract_regex(with_times, _DATE_TIME), [0])
+    other = pc.is_null(dates)
+    if pc.any(other).as_py():
+        stripped = pc.replace_substring_regex(pc.filter(with_times, other), _TIME, "")
+        dates = pc.replace_with_mask(dates, other, stripped)
+    return pc.replace_with_mask(values, timed, dates)
+
+
+def parse_unique(strings):
+    """
+    Parse distinct eventDate strings (without times, see ``_date_strings``).
+    Returns a frame indexed by the strings with the ``COLUMNS``;
+    unrecognised or impossible dates are all missing.
+    """
+    strings = pd.Index(strings, dtype=object)
+    parts = pc.extract_regex(pa.array(strings, type=pa.string(), from_pandas=True), _PATTERN)
+
+    y, m, d = _int(parts, "y"), _int(parts, "m"), _int(parts, "d")
+    ey, em, ed = _int(parts, "ey"), _int(parts, "em"), _int(parts, "ed")
+    a, b = _int(parts, "a"), _int(parts, "b")
+
+    # Abbreviated interval ends ("/03", "/06-03") repeat the start's leading
+    # fields: one number is the day of a full date or the month of a
+    # year-month, two numbers are month and day.
+    short = ~np.isnan(a)
+    two = short & ~np.isnan(b)
+    one_day = short & ~two & ~np.isnan(d)
+    one_month = short & ~two & np.isnan(d)
+    ey = np.where(short, y, ey)
+    em = np.select([two, one_day, one_month], [a, m, a], em)
+    ed = np.select([two, one_day], [b, a], ed)
+
+    # Single dates are intervals that end where they start
+    single = np.isnan(ey)
+    ey, em, ed = np.where(single, y, ey), np.where(single, m, em), np.where(single, d, ed)
+
+    valid = ~np.isnan(y)
+    for month, day in ((m, d), (em, ed)):
+        valid &= np.isnan(day) | ~np.isnan(month)
+        valid &= np.isnan(month) | ((month >= 1) & (month <= 12))
+
+    # A missing day means the whole month, a missing month the whole year
+    def fill(values, default):
+        return np.where(valid & ~np.isnan(values), values, default)
+
+    start_year, start_month = fill(y, 1970), fill(m, 1)
+    end_year, end_month = fill(ey, 1970), fill(em, 12)
+    start_day = fill(d, 1)
+    end_day = fill(ed, _days_in_month(end_year, end_month))
+    valid &= (start_day >= 1) & (start_day <= _days_in_month(start_year, start_month))
+    valid &= (end_day >= 1) & (end_day <= _days_in_month(end_year, end_month))
+
+    start_day, end_day = np.where(valid, start_day, 1), np.where(valid, end_day, 1)
+    start = _month(start_year, start_month).astype("datetime64[D]") + (start_day - 1).astype(np.int64)
+    end = _month(end_year, end_month).astype("datetime64[D]") + (end_day - 1).astype(np.int64)
+    valid &= end >= start
+
+    same_month = valid & (start_year == end_year) & (start_month == end_month) & ~np.isnan(m)
+    same_day = same_month & (start == end) & ~np.isnan(d)
+    nat = np.datetime64("NaT")
+    return pd.DataFrame({
+        "year": pd.array(np.where(valid, y, np.nan), dtype="Int16"),
+        "month": pd.array(np.where(same_month, m, np.nan), dtype="Int16"),
+        "day": pd.array(np.where(same_day, d, np.nan), dtype="Int16"),
+        "start": np.where(valid, start, nat).astype(DATE_UNIT),
+        "end": np.where(valid, end, nat).astype(DATE_UNIT),
+    }, index=strings)
+
+
+class EventDateParser:
+    """``parse_unique`` behind a cache of the strings already parsed."""
+
+    def __init__(self, max_entries=MAX_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.cache = parse_unique([])
+
+    def parse(self, values):
+        """Parse ``values`` (a Series of strings); returns ``COLUMNS`` aligned with it."""
+        values = pd.Series(values)
+        # Distinct dates once the times are dropped, so e.g. all timestamps
+        # of one day share a single entry
+        dates = pc.dictionary_encode(_date_strings(values))
+        uniques = pd.Index(dates.dictionary.to_numpy(zero_copy_only=False), dtype=object)
+        codes = dates.indices.fill_null(-1).to_numpy()
+
+        missing = uniques[~uniques.isin(self.cache.index)]
+        if len(missing):
+            if len(self.cache) + len(missing) > self.max_entries:
+                self.cache = parse_unique([])
+            self.cache = pd.concat([self.cache, parse_unique(missing)])
+
+        # The last row is the all-missing row for missing eventDates
+        parsed = self.cache.reindex(uniques).reset_index(drop=True)
+        parsed = pd.concat([parsed, parse_unique([None])], ignore_index=True)
+        codes = np.where(codes < 0, len(parsed) - 1, codes)
+        return parsed.take(codes).set_axis(values.index)
+
+
+_default_parser = EventDateParser()
+
+
+def parse_event_dates(values):
+    """Parse a Series of eventDate strings with the shared memoizing parser."""
+    return _default_parser.parse(values)
@@ -0,0 +1,94 @@
+"""
+Streaming export of filtered occurrences.
+
+Exports read the Parquet dataset through the same filter pushdown as the
+dashboard views (data_access.build_filter) and write it batch by batch, so
+the full result is never held in memory. Nothing is produced until an
+export is requested: the dashboard's download button calls
+``export_file`` only when it is clicked.
+"""
+
+import os
+import tempfile
+
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+
+import data_access
+
+# label -> (file extension, MIME type)
+EXPORT_FORMATS = {
+    "CSV": (".csv", "text/csv"),
+    "CSV (gzip)": (".csv.gz", "application/gzip"),
+    "Parquet": (".parquet", "application/vnd.apache.parquet"),
+}
+
+BATCH_ROWS = 64_000
+
+
+def _plain_schema(schema):
+    # CSV has no dictionary encoding; write the dictionary values
+    return pa.schema([
+        pa.field(f.name, f.type.value_type) if pa.types.is_dictionary(f.type) else f
+        for f in schema
+    ])
+
+
+def iter_batches(filter=None, columns=None, path=data_access.DATA_PATH):
+    """Record batches of the rows matching ``filter``."""
+    dataset = data_access.open_dataset(path)
+    return dataset.schema, dataset.to_batches(columns=columns, filter=filter, batch_size=BATCH_ROWS)
+
+
+def write_export(sink, fmt, filter=None, columns=None, path=data_access.DATA_PATH):
+    """Write the rows matching ``filter`` to ``sink`` (a path or file) in ``fmt``."""
+    schema, batches = iter_batches(filter, columns, path)
+    if columns is not None:
+        schema = pa.schema([schema.field(c) for c in columns])
+
+    if fmt == "Parquet":
+        with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+        return
+
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    plain = _plain_schema(schema)
+    stream = pa.OSFile(sink, "wb") if isinstance(sink, str) else pa.PythonFile(sink, mode="w")
+    if fmt == "CSV (gzip)":
+        stream = pa.CompressedOutputStream(stream, "gzip")
+    with stream, pv.CSVWriter(stream, plain) as writer:
+        for batch in batches:
+            writer.write_table(pa.Table.from_batches([batch]).cast(plain))
+
+
+def export_to_file(fmt, filter=None, columns=None, path=data_access.DATA_PATH, directory=None):
+    """Stream the export into a new temporary file and return its path."""
+    suffix = EXPORT_FORMATS[fmt][0]
+    fd, out_path = tempfile.mkstemp(prefix="gbif_export_", suffix=suffix, dir=directory)
+    os.close(fd)
+    try:
+        write_export(out_path, fmt, filter, columns, path)
+    except Exception:
+        os.remove(out_path)
+        raise
+    return out_path
+
+
+def export_file(fmt, filter=None, columns=None, path=data_access.DATA_PATH):
+    """
+    The export as a file open for reading, for a download. It is streamed
+    into a temporary file with no name on disk, removed once closed.
+    """
+    suffix = EXPORT_FORMATS[fmt][0]
+    with tempfile.TemporaryFile(prefix="gbif_export_", suffix=suffix) as f:
+        # The writers close their sink, and the reader outlives ``f``: each
+        # gets a descriptor of its own
+        with open(os.dup(f.fileno()), "wb") as sink:
+            write_export(sink, fmt, filter, columns, path)
+        reader = open(os.dup(f.fileno()), "rb")
+    reader.seek(0)
+    return reader
@@ -0,0 +1,190 @@
+"""
+Inverted indexes for the dashboard's sidebar filters.
+
+``FilterIndex`` is built once when the data is loaded. For every indexed
+column it sorts the row positions by value, so the rows holding a value are
+one contiguous slice of a position array (a posting list). Filters then
+resolve to sorted row positions by merging and intersecting posting lists,
+instead of comparing every row of every column on each rerun.
+
+An index can be turned into named numpy arrays (``arrays``) and rebuilt
+from them without sorting again (``from_arrays``), so the dashboard keeps
+one copy of it in shared memory for all its processes (see
+``data_access.read_shared_arrays``).
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def _factorize(series):
+    """Integer codes (-1 for missing) and the sorted distinct values."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = np.asarray(series.cat.categories)
+        order = np.argsort(categories, kind="stable")
+        remap = np.empty(len(order), dtype=np.int64)
+        remap[order] = np.arange(len(order))
+        codes = series.cat.codes.to_numpy().astype(np.int64)
+        codes = np.where(codes >= 0, remap[np.maximum(codes, 0)], -1)
+        return codes, categories[order]
+    codes, uniques = pd.factorize(series, sort=True)
+    return codes.astype(np.int64), np.asarray(uniques)
+
+
+def _member(sorted_rows, rows):
+    """Boolean mask of which ``rows`` appear in ``sorted_rows``."""
+    idx = np.searchsorted(sorted_rows, rows)
+    idx[idx == len(sorted_rows)] = 0
+    return sorted_rows[idx] == rows if len(sorted_rows) else np.zeros(len(rows), dtype=bool)
+
+
+def intersect(rows, other):
+    """Intersection of two sorted row-position arrays; ``None`` means all rows."""
+    if rows is None:
+        return other
+    if other is None:
+        return rows
+    if len(rows) > len(other):
+        rows, other = other, rows
+    return rows[_member(other, rows)]
+
+
+class _Postings:
+    """Row positions of one column grouped by value."""
+
+    def __init__(self, codes, uniques):
+        present = codes >= 0
+        counts = np.bincount(codes[present], minlength=len(uniques))
+
+        # Values that never occur (unused categories) are dropped
+        keep = counts > 0
+        if not keep.all():
+            remap = np.cumsum(keep) - 1
+            codes = np.where(present, remap[np.maximum(codes, 0)], -1)
+            uniques, counts = uniques[keep], counts[keep]
+
+        self.values = uniques
+        self.counts = counts
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+        # A stable sort keeps positions ascending within each value
+        self.positions = np.argsort(np.where(present, codes, len(uniques)), kind="stable")
+        self.positions = self.positions[:self.offsets[-1]]
+        self._lookup = {v: i for i, v in enumerate(uniques.tolist())}
+
+    def arrays(self):
+        return {"values": self.values, "counts": self.counts, "offsets": self.offsets, "positions": self.positions}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        postings = cls.__new__(cls)
+        postings.values = arrays["values"]
+        postings.counts = arrays["counts"]
+        postings.offsets = arrays["offsets"]
+        postings.positions = arrays["positions"]
+        postings._lookup = {v: i for i, v in enumerate(postings.values.tolist())}
+        return postings
+
+    def codes_for(self, values):
+        return [self._lookup[v] for v in values if v in self._lookup]
+
+    def rows(self, codes):
+        """Sorted row positions holding any of the value ``codes``."""
+        parts = [self.positions[self.offsets[c]:self.offsets[c + 1]] for c in codes]
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        if len(parts) == 1:
+            return parts[0]
+        return np.sort(np.concatenate(parts))
+
+    def size(self, codes):
+        return int(self.counts[codes].sum()) if codes else 0
+
+
+class FilterIndex:
+    """
+    Posting-list indexes over the filter columns of a DataFrame.
+
+    ``columns`` are indexed by exact value; ``lowercase`` columns are indexed
+    by their lowercased value, for case-insensitive lookups.
+    """
+
+    def __init__(self, df, columns=("countryCode", "kingdom", "year"), lowercase=("species",)):
+        self.n_rows = len(df)
+        self._postings = {}
+        for col in columns:
+            self._postings[col] = _Postings(*_factorize(df[col]))
+        for col in lowercase:
+            codes, uniques = _factorize(df[col])
+            # Lowercase only the distinct values and merge case variants
+            lower_codes, lower_uniques = pd.factorize(pd.Series(uniques, dtype=object).str.lower(), sort=True)
+            codes = np.where(codes >= 0, lower_codes[np.maximum(codes, 0)], -1)
+            self._postings[col] = _Postings(codes, np.asarray(lower_uniques))
+
+    def arrays(self):
+        """The index as named arrays, for ``from_arrays``."""
+        arrays = {"n_rows": np.array([self.n_rows], dtype=np.int64)}
+        for col, postings in self._postings.items():
+            for key, values in postings.arrays().items():
+                arrays[f"{col}.{key}"] = values
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        index = cls.__new__(cls)
+        index.n_rows = int(arrays["n_rows"][0])
+        parts = {}
+        for name, values in arrays.items():
+            if name != "n_rows":
+                col, key = name.rsplit(".", 1)
+                parts.setdefault(col, {})[key] = values
+        index._postings = {col: _Postings.from_arrays(p) for col, p in parts.items()}
+        return index
+
+    def values(self, col):
+        """Sorted distinct values of an indexed column."""
+        return self._postings[col].values.tolist()
+
+    def resolve(self, **selections):
+        """
+        Sorted row positions matching every selection, or ``None`` for all rows.
+
+        Each keyword names an indexed column and gives either one value or a
+        list of accepted values; ``None`` leaves the column unrestricted.
+        """
+        include, exclude = [], []
+        for col, selected in selections.items():
+            if selected is None:
+                continue
+            postings = self._postings[col]
+            if isinstance(selected, (list, tuple, set, np.ndarray)):
+                codes = postings.codes_for(selected)
+            else:
+                codes = postings.codes_for([selected])
+
+            # Wide selections are cheaper as the rows they leave out
+            size = postings.size(codes)
+            if size > self.n_rows // 2:
+                others = np.setdiff1d(np.arange(len(postings.values)), codes, assume_unique=True)
+                missing = self.n_rows - int(postings.counts.sum())
+                if missing == 0:
+                    exclude.append(postings.rows(others.tolist()))
+                    continue
+            include.append(postings.rows(codes))
+
+        if not include and not exclude:
+            return None
+
+        if include:
+            include.sort(key=len)
+            rows = include[0]
+            # Probe the larger sets with the smallest one (binary search)
+            for other in include[1:]:
+                rows = intersect(rows, other)
+            for other in exclude:
+                rows = rows[~_member(other, rows)]
+            return rows
+
+        keep = np.ones(self.n_rows, dtype=bool)
+        for other in exclude:
+            keep[other] = False
+        return np.flatnonzero(keep)
@@ -0,0 +1,284 @@
+"""
+Incremental ingest of a new GBIF download into the existing dataset.
+
+Raw rows whose ``gbifID`` or ``occurrenceID`` is already in
+``gbif_cleaned.parquet`` (or earlier in the same download) are dropped
+before cleaning, so only new occurrences go through ``clean_chunk``. They
+are typed exactly as convert_data.py types the cleaned CSV, written as new
+files in the dataset's hive partitions, counted into a delta cube that is
+added to ``gbif_cube.parquet``, and optionally appended to the cleaned CSV
+used by the EDA script. The dashboard picks the new files up on its next
+rerun (see ``data_access.dataset_version``).
+
+Nothing is changed until the whole download has been processed: the new
+files and the CSV rows are written to a staging directory next to the
+dataset and the cube cells are added up in memory, and all of them only
+move into place at the end, so a run that fails leaves the dataset and the
+cube as they were. The cube is written last, recording the dataset's new
+version (see ``cube.load_cube``).
+
+Usage: python ingest.py new_download.csv
+"""
+
+import io
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+import cube
+import data_access
+from cleaning import DEFAULT_CHUNKSIZE, clean_chunk, iter_raw_chunks
+from convert_data import TYPE_NAMES, iter_csv_batches, type_name, write_dataset
+from schema_inference import INT_TYPES, load_schema, save_schema, schema_path
+
+
+class KnownIds:
+    """
+    Identifiers of the occurrences already ingested. The hash table of the
+    dataset's ids is built once; ids added by this run are kept in sets of
+    their own, so checking a chunk takes time in the chunk's size rather
+    than the dataset's.
+    """
+
+    def __init__(self, gbif_ids, occurrence_ids):
+        self.gbif_ids = pd.Index(np.unique(gbif_ids))
+        self.occurrence_ids = pd.Index(pc.unique(occurrence_ids).to_numpy(zero_copy_only=False))
+        self.new_gbif_ids = set()
+        self.new_occurrence_ids = set()
+
+    @classmethod
+    def from_dataset(cls, path=data_access.DATA_PATH):
+        # Only the two identifier columns are scanned
+        table = data_access.read_table(["gbifID", "occurrenceID"], path=path)
+        gbif_ids = np.empty(0, np.int64)
+        occurrence_ids = pa.array([], pa.string())
+        if "gbifID" in table.column_names:
+            gbif_ids = table["gbifID"].drop_null().to_numpy()
+        if "occurrenceID" in table.column_names:
+            occurrence_ids = table["occurrenceID"].drop_null()
+        return cls(gbif_ids, occurrence_ids)
+
+    @staticmethod
+    def _seen(values, history, added):
+        in_history = history.get_indexer(values) >= 0
+        in_run = np.fromiter((v in added for v in values.tolist()), dtype=bool, count=len(values))
+        return in_history | in_run
+
+    def new_rows(self, chunk):
+        """
+        Rows of the raw ``chunk`` whose ids have not been seen, keeping the
+        first of any repeats inside the chunk. Their ids become known.
+        """
+        keep = np.ones(len(chunk), dtype=bool)
+
+        if "gbifID" in chunk:
+            ids = pd.to_numeric(chunk["gbifID"], errors="coerce")
+            has_id = ids.notna().to_numpy()
+            gbif_ids = ids.fillna(-1).to_numpy(dtype=np.int64)
+            seen = self._seen(gbif_ids, self.gbif_ids, self.new_gbif_ids) | ids.duplicated().to_numpy()
+            keep &= ~(has_id & seen)
+
+        if "occurrenceID" in chunk:
+            occ = chunk["occurrenceID"]
+            has_occ = occ.notna().to_numpy()
+            occurrence_ids = occ.to_numpy(dtype=object)
+            seen = self._seen(occurrence_ids, self.occurrence_ids, self.new_occurrence_ids)
+            keep &= ~(has_occ & (seen | occ.duplicated().to_numpy()))
+
+        if "gbifID" in chunk:
+            self.new_gbif_ids.update(gbif_ids[keep & has_id].tolist())
+        if "occurrenceID" in chunk:
+            self.new_occurrence_ids.update(occurrence_ids[keep & has_occ].tolist())
+        return chunk[keep]
+
+
+def _widen(schema, cleaned, partition_by):
+    """
+    ``schema`` with each integer column too narrow for the values of
+    ``cleaned`` widened to the smallest type holding them (float64 for
+    fractional values). The partition column keeps its type.
+    """
+    for i, field in enumerate(schema):
+        if not pa.types.is_integer(field.type) or field.name == partition_by or field.name not in cleaned:
+            continue
+        values = pd.to_numeric(cleaned[field.name], errors="coerce").dropna().to_numpy(dtype=np.float64)
+        if len(values) == 0:
+            continue
+        wide = pa.float64()
+        if np.all(values == np.floor(values)):
+            for name, int_type in INT_TYPES:
+                info = np.iinfo(int_type)
+                if info.bits >= field.type.bit_width and info.min <= values.min() and values.max() <= info.max:
+                    wide = TYPE_NAMES[name]
+                    break
+        if wide != field.type:
+            schema = schema.set(i, field.with_type(wide))
+    return schema
+
+
+def _to_table(cleaned, schema):
+    # Round-trip through CSV text so the delta is typed exactly like rows
+    # converted from gbif_cleaned.csv by convert_data.py, with the columns
+    # and types of the existing dataset
+    cleaned = cleaned.reindex(columns=schema.names)
+    buffer = io.BytesIO(cleaned.to_csv(index=False).encode("utf-8"))
+    return pa.Table.from_batches(list(iter_csv_batches(buffer, schema)), schema=schema)
+
+
+def _csv_rows(cleaned, columns, csv_path):
+    """
+    ``cleaned`` with the columns of the CSV at ``csv_path``, in its order
+    (the cleaning step may have pruned columns, and a download may order
+    them differently).
+    """
+    missing = [col for col in columns if col not in cleaned]
+    if missing:
+        raise ValueError(f"the new rows have no {', '.join(missing)} column for {csv_path}")
+    return cleaned[columns]
+
+
+def _widened_csv_schema(csv_schema, schema, original_schema):
+    """The cleaned CSV's saved schema with the columns widened by this run."""
+    columns = []
+    for column in csv_schema["columns"]:
+        name = column["name"]
+        if name in schema.names and schema.field(name).type != original_schema.field(name).type:
+            column = dict(column, type=type_name(schema.field(name).type))
+        columns.append(column)
+    return dict(csv_schema, columns=columns)
+
+
+def _move_files(src_dir, dst_dir):
+    # Each staged file goes to the same relative path (partition directory)
+    for root, _, names in os.walk(src_dir):
+        target = os.path.join(dst_dir, os.path.relpath(root, src_dir))
+        os.makedirs(target, exist_ok=True)
+        for name in names:
+            os.replace(os.path.join(root, name), os.path.join(target, name))
+
+
+def _append_file(src_path, dst_path):
+    with open(src_path, "rb") as src, open(dst_path, "ab") as dst:
+        shutil.copyfileobj(src, dst)
+
+
+def ingest(raw_path, data_path=data_access.DATA_PATH, cube_path=cube.CUBE_PATH, clean_csv_path=None,
+           chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Append the occurrences of ``raw_path`` that are not yet in ``data_path``.
+
+    Returns a report with the raw, duplicate and written row counts and the
+    rows remaining after each cleaning stage.
+    """
+    partition_by = data_access.partition_column(data_path)
+    if partition_by is None:
+        raise ValueError(f"{data_path} is not a partitioned dataset; run convert_data.py first")
+
+    schema = original_schema = data_access.open_dataset(data_path).schema
+    known_version = data_access.dataset_version(data_path)
+    known = KnownIds.from_dataset(data_path)
+    run_id = time.strftime("%Y%m%d-%H%M%S")
+    stages = {}
+    rows_in = rows_new = rows_out = 0
+    delta_cubes = []
+
+    # Staged next to the dataset, so the files are moved on one filesystem
+    staging = f"{os.path.normpath(data_path)}.ingest-{run_id}"
+    staged_data = os.path.join(staging, "data")
+    staged_cube = os.path.join(staging, "cube.parquet")
+    staged_csv = os.path.join(staging, "cleaned.csv")
+    staged_csv_schema = os.path.join(staging, "cleaned.schema.json")
+    # Rows appended to an existing CSV follow its header
+    csv_columns = None
+    if clean_csv_path is not None and os.path.exists(clean_csv_path):
+        csv_columns = list(pd.read_csv(clean_csv_path, nrows=0).columns)
+    try:
+        for i, chunk in enumerate(iter_raw_chunks(raw_path, chunksize)):
+            rows_in += len(chunk)
+            chunk = known.new_rows(chunk)
+            rows_new += len(chunk)
+            if chunk.empty:
+                continue
+
+            cleaned = clean_chunk(chunk, stages)
+            if cleaned.empty:
+                continue
+            # Values the dataset's types cannot hold (e.g. a count above the
+            # int8 range of the first download) widen the column
+            schema = _widen(schema, cleaned, partition_by)
+            table = _to_table(cleaned, schema)
+
+            # Unique file names, so existing files are never overwritten
+            write_dataset(
+                table.to_batches(), table.schema, staged_data, partition_by,
+                basename_template=f"ingest-{run_id}-{i}-{{i}}.parquet",
+                existing_data_behavior="overwrite_or_ignore",
+            )
+            delta_cubes.append(cube.cube_from_table(table))
+
+            if clean_csv_path is not None:
+                write_header = csv_columns is None
+                if csv_columns is None:
+                    csv_columns = list(cleaned.columns)
+                rows = _csv_rows(cleaned, csv_columns, clean_csv_path)
+                rows.to_csv(staged_csv, mode="a", header=write_header, index=False)
+            rows_out += len(cleaned)
+
+        # A cube already out of date with the dataset is left as it is (the
+        # dashboard ignores it); adding the new cells would not fix it
+        updated_cube = None
+        if delta_cubes and os.path.exists(cube_path) and cube.cube_version(cube_path) == known_version:
+            updated_cube = cube.merge_cubes([cube.read_cube(cube_path)] + delta_cubes)
+
+        if schema != original_schema:
+            pq.write_metadata(schema, os.path.join(staged_data, data_access.COMMON_METADATA))
+            # The CSV's saved schema types its columns when it is reloaded
+            csv_schema = load_schema(schema_path(clean_csv_path)) if os.path.exists(staged_csv) else None
+            if csv_schema is not None:
+                save_schema(_widened_csv_schema(csv_schema, schema, original_schema), staged_csv_schema)
+
+        # Everything is staged: move it into place
+        if os.path.isdir(staged_data):
+            _move_files(staged_data, data_path)
+        if updated_cube is not None:
+            # Written once the files are in place, with the dataset's new version
+            cube.write_cube(updated_cube, staged_cube, data_access.dataset_version(data_path))
+            os.replace(staged_cube, cube_path)
+        if os.path.exists(staged_csv):
+            _append_file(staged_csv, clean_csv_path)
+        if os.path.exists(staged_csv_schema):
+            os.replace(staged_csv_schema, schema_path(clean_csv_path))
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    return {
+        "rows_in": rows_in,
+        "duplicates": rows_in - rows_new,
+        "stages": stages,
+        "rows_out": rows_out,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Add a new GBIF download to the existing dataset")
+    parser.add_argument("raw_csv")
+    parser.add_argument("--data", default=data_access.DATA_PATH)
+    parser.add_argument("--cube", default=cube.CUBE_PATH)
+    parser.add_argument("--csv", default=None, help="also append the new cleaned rows to this CSV")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    args = parser.parse_args()
+
+    report = ingest(args.raw_csv, args.data, args.cube, args.csv, args.chunksize)
+    print(f"Raw rows: {report['rows_in']}")
+    print(f"Already ingested: {report['duplicates']}")
+    for stage, count in report["stages"].items():
+        print(f"Rows after {stage}: {count}")
+    print(f"Rows added: {report['rows_out']}")
@@ -0,0 +1,338 @@
+"""
+Run manifests for the cleaning and conversion steps.
+
+Each run of a step records, in a JSON file next to its output, what it
+read (paths, sizes and SHA-256 of the inputs), what it did (settings, row
+counts, wall time and peak memory per stage) and what it wrote. The
+cleaning and conversion steps of one dataset share a manifest
+(``gbif_cleaned.manifest.json``), one entry per step, so the conversion's
+input hash can be matched against the cleaning's output.
+
+The peak memory of a stage is the resident peak of the process (and its
+workers) so far. The cleaning steps within a stage record their own peak:
+while ``sampling_memory`` is active, a background thread samples the
+resident memory, and each step keeps the highest sample taken while it ran.
+With ``trace=True`` tracemalloc also traces the allocations made through
+Python (``traced_peak_mb``), which is much slower.
+
+A step whose inputs have the same hashes as in its last recorded run, and
+whose outputs are still in place, can be skipped (``is_current``). The
+timings make regressions visible when manifests of different releases are
+compared; ``python manifest.py`` prints them as Prometheus metrics.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+MANIFEST_SUFFIX = ".manifest.json"
+
+METRIC_PREFIX = "gbif_pipeline"
+
+HASH_BLOCK_SIZE = 8 << 20
+
+MEMORY_SAMPLE_SECONDS = 0.01
+
+
+def manifest_path(output_path):
+    """Manifest shared by the outputs named like ``output_path`` (any extension)."""
+    return os.path.splitext(output_path.rstrip("/\\"))[0] + MANIFEST_SUFFIX
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_info(path, with_hash=True):
+    """Size (and hash) of a file, or total size and file count of a directory."""
+    if os.path.isdir(path):
+        sizes = [os.path.getsize(os.path.join(root, name))
+                 for root, _, names in os.walk(path) for name in names]
+        return {"path": path, "files": len(sizes), "size": sum(sizes)}
+    info = {"path": path, "size": os.path.getsize(path)}
+    if with_hash:
+        info["sha256"] = file_sha256(path)
+    return info
+
+
+def peak_memory_mb():
+    """Peak resident memory so far of this process and its workers, or None."""
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return round(peak / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def is_current(path, step, inputs, settings=None):
+    """
+    True if the manifest at ``path`` records ``step`` with the same input
+    hashes as ``inputs`` (name -> file_info), and the same ``settings`` if
+    given, and its outputs still exist with their recorded sizes.
+    """
+    manifest = load_manifest(path)
+    run = (manifest or {}).get("steps", {}).get(step)
+    if run is None:
+        return False
+    if settings is not None and run["settings"] != settings:
+        return False
+    if {name: info.get("sha256") for name, info in run["inputs"].items()} != \
+            {name: info.get("sha256") for name, info in inputs.items()}:
+        return False
+    for info in run["outputs"].values():
+        if not os.path.exists(info["path"]) or file_info(info["path"], with_hash=False)["size"] != info["size"]:
+            return False
+    return True
+
+
+class StepRun:
+    """Collects the record of one run of a pipeline step."""
+
+    def __init__(self, step, inputs, settings=None):
+        self.step = step
+        self.record = {
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "inputs": inputs,
+            "settings": settings or {},
+            "stages": {},
+            "rows": {},
+            "outputs": {},
+        }
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        """Record the wall time of the block and the peak memory after it."""
+        start = time.perf_counter()
+        yield
+        self.record["stages"][name] = {
+            "seconds": round(time.perf_counter() - start, 3),
+            "peak_memory_mb": peak_memory_mb(),
+        }
+
+    def finish(self, outputs, **extra):
+        """Record the outputs (name -> path) and any extra report sections."""
+        self.record["outputs"] = {name: file_info(path) for name, path in outputs.items()}
+        self.record["seconds"] = round(time.perf_counter() - self._start, 3)
+        self.record["peak_memory_mb"] = peak_memory_mb()
+        self.record.update(extra)
+
+    def save(self, path):
+        """Store the record as this step's entry of the manifest at ``path``."""
+        manifest = load_manifest(path) or {"steps": {}}
+        manifest["steps"][self.step] = self.record
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, path)
+
+
+# ===============================
+# Memory of the steps within a stage
+# ===============================
+def current_memory_mb():
+    """Resident memory of this process now, or None where it cannot be read."""
+    if psutil is not None:
+        rss = psutil.Process().memory_info().rss
+    elif os.path.exists("/proc/self/statm"):
+        with open("/proc/self/statm") as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    else:
+        return None
+    return round(rss / (1 << 20), 1)
+
+
+def traced_peak_mb():
+    """
+    Peak of the memory traced by tracemalloc since the previous call, in
+    MB, or None when it is not tracing. Counts the memory allocated through
+    Python (numpy and pandas buffers included), not Arrow's memory pool.
+    """
+    if not tracemalloc.is_tracing():
+        return None
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.reset_peak()
+    return round(peak / (1 << 20), 1)
+
+
+class MemorySampler:
+    """Samples the resident memory of this process on a background thread."""
+
+    def __init__(self, trace=False, interval=MEMORY_SAMPLE_SECONDS):
+        self.trace = trace
+        self.interval = interval
+        self.pid = os.getpid()
+        self._peak = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._tracing = False
+
+    def _run(self):
+        while not self._done.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        mb = current_memory_mb()
+        if mb is not None:
+            with self._lock:
+                self._peak = mb if self._peak is None else max(self._peak, mb)
+
+    def start(self):
+        self._tracing = self.trace and not tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.start()
+        self._sample()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._done.set()
+        self._thread.join()
+        if self._tracing:
+            tracemalloc.stop()
+
+    def peaks(self):
+        """
+        The highest resident memory sampled since the previous call (or the
+        start) and, when tracing, the peak traced memory, in MB.
+        """
+        self._sample()
+        with self._lock:
+            peak, self._peak = self._peak, None
+        peaks = {"peak_memory_mb": peak}
+        if self.trace:
+            peaks["traced_peak_mb"] = traced_peak_mb()
+        return peaks
+
+
+_sampler = None
+
+
+def _active_sampler():
+    # A sampler inherited by a forked worker has no thread in it
+    return _sampler if _sampler is not None and _sampler.pid == os.getpid() else None
+
+
+def start_memory_sampling(trace=False):
+    """Start sampling for ``step_peaks`` in this process, unless it already is."""
+    global _sampler
+    if _active_sampler() is None:
+        _sampler = MemorySampler(trace).start()
+        return True
+    return False
+
+
+def stop_memory_sampling():
+    global _sampler
+    if _active_sampler() is not None:
+        _sampler.stop()
+    _sampler = None
+
+
+@contextmanager
+def sampling_memory(trace=False):
+    """Sample the memory of this process during the block (see ``step_peaks``)."""
+    started = start_memory_sampling(trace)
+    try:
+        yield
+    finally:
+        if started:
+            stop_memory_sampling()
+
+
+def sampling_settings():
+    """The settings of the sampler running in this process (for its workers), or None."""
+    sampler = _active_sampler()
+    return None if sampler is None else {"trace": sampler.trace}
+
+
+def step_peaks():
+    """``MemorySampler.peaks`` of the sampler running in this process, or None."""
+    sampler = _active_sampler()
+    return None if sampler is None else sampler.peaks()
+
+
+# ===============================
+# Prometheus export
+# ===============================
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def to_prometheus(manifest):
+    """
+    The wall time and peak memory of every stage and cleaning step recorded
+    in ``manifest``, in the Prometheus text exposition format. Stages are
+    labelled ``stage`` (``total`` for the whole run), the steps within them
+    ``substep``.
+    """
+    metrics = {
+        "seconds": "Wall time of each pipeline stage.",
+        "peak_memory_mb": "Peak resident memory of each pipeline stage, in MB.",
+        "traced_peak_mb": "Peak memory allocated during each pipeline stage (tracemalloc), in MB.",
+    }
+    samples = {key: [] for key in metrics}
+
+    def add(labels, record):
+        for key in metrics:
+            if record.get(key) is not None:
+                samples[key].append(f"{METRIC_PREFIX}_{key}{{{labels}}} {record[key]}")
+
+    for step, run in sorted(manifest.get("steps", {}).items()):
+        step_label = f'step="{_label(step)}"'
+        for name, record in list(run["stages"].items()) + [("total", run)]:
+            add(f'{step_label},stage="{_label(name)}"', record)
+        substeps = {name: {"seconds": seconds} for name, seconds in run.get("step_seconds", {}).items()}
+        for name, memory in run.get("step_memory", {}).items():
+            substeps.setdefault(name, {}).update(memory)
+        for name, record in substeps.items():
+            add(f'{step_label},substep="{_label(name)}"', record)
+
+    lines = []
+    for key, help_text in metrics.items():
+        if samples[key]:
+            lines += [f"# HELP {METRIC_PREFIX}_{key} {help_text}", f"# TYPE {METRIC_PREFIX}_{key} gauge"]
+            lines += samples[key]
+    return "\n".join(lines) + "\n"
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Print the timings and peak memory of a run manifest as Prometheus metrics")
+    parser.add_argument("manifest", nargs="?", default=manifest_path("gbif_cleaned.csv"))
+    args = parser.parse_args()
+
+    manifest = load_manifest(args.manifest)
+    if manifest is None:
+        sys.exit(f"{args.manifest} not found")
+    print(to_prometheus(manifest), end="")
@@ -0,0 +1,135 @@
+"""
+Folium layers for the occurrence map.
+
+The cluster and heat layers are built from weighted cell centroids (see
+spatial.bin_points); the point layer draws individual occurrences and the
+raster layer a pre-rendered density image.
+"""
+
+import sys
+
+import folium
+import numpy as np
+import pandas as pd
+from folium.plugins import FastMarkerCluster, HeatMap
+
+import raster
+
+# Each marker carries the number of records in its cell; cluster bubbles
+# show the sum of those weights instead of the number of markers.
+_WEIGHTED_MARKER = """
+function (row) {
+    var marker = L.marker(new L.LatLng(row[0], row[1]));
+    marker.weight = row[2];
+    marker.bindTooltip(row[2] + (row[2] == 1 ? " record" : " records"));
+    return marker;
+}
+"""
+
+_WEIGHTED_CLUSTER_ICON = """
+function (cluster) {
+    var total = 0;
+    cluster.getAllChildMarkers().forEach(function (m) { total += m.weight || 1; });
+    var size = total < 100 ? "small" : (total < 1000 ? "medium" : "large");
+    return L.divIcon({
+        html: "<div><span>" + total + "</span></div>",
+        className: "marker-cluster marker-cluster-" + size,
+        iconSize: new L.Point(40, 40)
+    });
+}
+"""
+
+
+def _rows(cells, weights):
+    return np.column_stack([cells["lat"].to_numpy(), cells["lon"].to_numpy(), weights]).tolist()
+
+
+def cluster_layer(cells):
+    return FastMarkerCluster(
+        data=_rows(cells, cells["weight"].to_numpy()),
+        callback=_WEIGHTED_MARKER,
+        icon_create_function=_WEIGHTED_CLUSTER_ICON,
+    )
+
+
+def heat_layer(cells):
+    # Log-scaled so a few very dense cells do not wash out the rest
+    weight = np.log1p(cells["weight"].to_numpy(dtype=np.float64))
+    if len(weight) and weight.max() > 0:
+        weight = weight / weight.max()
+    return HeatMap(_rows(cells, weight))
+
+
+class PointCollection(dict):
+    """
+    A GeoJSON FeatureCollection of points that knows roughly how much memory
+    it holds, so the query cache can size it without walking every point.
+    """
+
+    nbytes = 0
+
+
+def point_collection(df, lat_col="decimalLatitude", lon_col="decimalLongitude", label_col="species"):
+    """
+    The points of ``df`` as a GeoJSON FeatureCollection for ``point_layer``.
+
+    Points with the same label share one MultiPoint feature, so there is one
+    feature per label rather than per point; the coordinates are sorted and
+    split by label with numpy.
+    """
+    labels = df[label_col].astype(object).where(df[label_col].notna(), "Unknown")
+    codes, uniques = pd.factorize(labels.to_numpy())
+    order = np.argsort(codes, kind="stable")
+    coords = np.column_stack([
+        df[lon_col].to_numpy(dtype=np.float64)[order],
+        df[lat_col].to_numpy(dtype=np.float64)[order],
+    ]).round(5)
+    ends = np.cumsum(np.bincount(codes, minlength=len(uniques)))[:-1]
+
+    features = [
+        {"type": "Feature", "geometry": {"type": "MultiPoint", "coordinates": points.tolist()},
+         "properties": {"label": label}}
+        for label, points in zip(uniques, np.split(coords, ends))
+    ]
+    collection = PointCollection(type="FeatureCollection", features=features)
+    # Each point is a two-item list of floats; each feature four small dicts
+    point_size = sys.getsizeof([0.0, 0.0]) + 2 * sys.getsizeof(0.0)
+    collection.nbytes = len(coords) * point_size + len(features) * 4 * sys.getsizeof({})
+    return collection
+
+
+def point_layer(collection):
+    """
+    One GeoJSON layer holding the points of a ``point_collection``.
+
+    All points share a single circle-marker style. Popups are bound on the
+    client and only rendered when a point is clicked. Use with
+    ``folium.Map(prefer_canvas=True)`` so the markers are drawn on a canvas
+    instead of as SVG nodes.
+    """
+    return folium.GeoJson(
+        collection,
+        name="Points",
+        marker=folium.CircleMarker(radius=3, color="blue", fill=True, fill_opacity=0.7),
+        popup=folium.GeoJsonPopup(fields=["label"], labels=False),
+    )
+
+
+def raster_layer(image, extent=raster.MAP_EXTENT, opacity=0.8):
+    """
+    A pre-rendered density image (see raster.render) as a static overlay.
+
+    The image must be rendered with ``mercator=True``: its rows are already
+    laid out in Web Mercator, so folium passes its pixels through as they
+    are (``mercator_project`` would rescale each column and change the
+    colours).
+    """
+    west, east, south, north = extent
+    return folium.raster_layers.ImageOverlay(
+        image,
+        bounds=[[south, west], [north, east]],
+        opacity=opacity,
+        mercator_project=False,
+        interactive=False,
+        zindex=1,
+    )
@@ -0,0 +1,146 @@
+"""
+Timing of the dashboard's reruns.
+
+``RerunTimer`` splits one run of dashboard.py into named stages with
+``lap(name)`` checkpoints. Each lap records the wall time since the
+previous one. ``size(name, value)`` records payload sizes, such as the
+points sent to the map or the bytes of the rendered map. A disabled timer
+does nothing: ``lap`` and ``size`` return at once and size callbacks are
+never called.
+
+Finished reruns are added to a ``PerfMetrics`` registry shared by the
+sessions of a process. It keeps the rerun count, per-stage latency
+histograms and the last payload sizes, and exports them as JSON or in the
+Prometheus text format. Each rerun is also logged as one JSON line on
+this module's logger.
+"""
+
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = "gbif_dashboard"
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RerunTimer:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.stages = {}
+        self.sizes = {}
+        if enabled:
+            self._start = self._last = time.perf_counter()
+
+    def lap(self, name):
+        """Add the time since the previous lap (or the start) to stage ``name``."""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.stages[name] = self.stages.get(name, 0.0) + now - self._last
+        self._last = now
+
+    def size(self, name, value):
+        """
+        Record a payload size. ``value`` may be a function; it is only called
+        when the timer is enabled, and its time is left out of the stages.
+        """
+        if not self.enabled:
+            return
+        if callable(value):
+            start = time.perf_counter()
+            value = value()
+            self._last += time.perf_counter() - start
+        self.sizes[name] = value
+
+    def record(self):
+        """The rerun so far as a JSON-friendly dict (times in seconds)."""
+        return {
+            "total_seconds": round(time.perf_counter() - self._start, 6),
+            "stages": {name: round(seconds, 6) for name, seconds in self.stages.items()},
+            "sizes": dict(self.sizes),
+        }
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class PerfMetrics:
+    """Rerun timings accumulated across sessions; thread-safe."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.reruns = 0
+        self._stages = {}  # name -> {"count", "sum", "max", "buckets"}
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        """Add a ``RerunTimer.record()`` and log it."""
+        logger.info(json.dumps(record))
+        with self._lock:
+            self.reruns += 1
+            for name, seconds in list(record["stages"].items()) + [("total", record["total_seconds"])]:
+                stats = self._stages.setdefault(
+                    name, {"count": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * len(self.buckets)}
+                )
+                stats["count"] += 1
+                stats["sum"] += seconds
+                stats["max"] = max(stats["max"], seconds)
+                for i, bound in enumerate(self.buckets):
+                    if seconds <= bound:
+                        stats["buckets"][i] += 1
+            self._sizes.update(record["sizes"])
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "reruns": self.reruns,
+                "stages": {
+                    name: {
+                        "count": stats["count"],
+                        "mean_seconds": stats["sum"] / stats["count"],
+                        "max_seconds": stats["max"],
+                    }
+                    for name, stats in self._stages.items()
+                },
+                "sizes": dict(self._sizes),
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """The metrics in the Prometheus text exposition format."""
+        histogram = f"{METRIC_PREFIX}_stage_seconds"
+        lines = [
+            f"# HELP {METRIC_PREFIX}_reruns_total Dashboard reruns timed.",
+            f"# TYPE {METRIC_PREFIX}_reruns_total counter",
+        ]
+        with self._lock:
+            lines.append(f"{METRIC_PREFIX}_reruns_total {self.reruns}")
+            lines += [
+                f"# HELP {histogram} Wall time of each stage of a dashboard rerun.",
+                f"# TYPE {histogram} histogram",
+            ]
+            for name, stats in sorted(self._stages.items()):
+                stage = _label(name)
+                # Each bucket counts the laps at or under its bound (cumulative)
+                for bound, count in zip(self.buckets, stats["buckets"]):
+                    lines.append(f'{histogram}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'{histogram}_bucket{{stage="{stage}",le="+Inf"}} {stats["count"]}')
+                lines.append(f'{histogram}_sum{{stage="{stage}"}} {stats["sum"]}')
+                lines.append(f'{histogram}_count{{stage="{stage}"}} {stats["count"]}')
+            if self._sizes:
+                lines += [
+                    f"# HELP {METRIC_PREFIX}_payload_size Payload sizes of the last rerun.",
+                    f"# TYPE {METRIC_PREFIX}_payload_size gauge",
+                ]
+                for name, value in sorted(self._sizes.items()):
+                    lines.append(f'{METRIC_PREFIX}_payload_size{{name="{_label(name)}"}} {value}')
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,97 @@
+"""
+Data-quality profiling for GBIF occurrence exports.
+
+``profile_frame`` computes the missing-value tables and every inconsistency
+check declared in cleaning_rules.json (see rules.py) in one pass over the
+columns, without building filtered copies of the rows. Text checks run on
+each column's distinct values, so a long column with few distinct values is
+stripped and matched only once per value.
+
+The result is a plain dict that can be merged across chunks
+(``merge_profiles``) and persisted as JSON (``save_profile``).
+"""
+
+import json
+
+import pandas as pd
+
+from rules import default_rules
+
+
+def profile_frame(df, rules=None):
+    """
+    Return the data-quality profile of ``df`` as a JSON-friendly dict.
+
+    The checks are those of ``rules`` (default: cleaning_rules.json).
+    """
+    rules = rules or default_rules()
+    missing_count = df.isna().sum()
+    return {
+        "rows": len(df),
+        "missing_count": {col: int(n) for col, n in missing_count.items()},
+        "checks": rules.check_counts(df),
+    }
+
+
+def merge_profiles(profiles):
+    """Combine the profiles of consecutive chunks into one profile."""
+    merged = {"rows": 0, "missing_count": {}, "checks": {}}
+    for profile in profiles:
+        merged["rows"] += profile["rows"]
+        for key in ["missing_count", "checks"]:
+            for name, count in profile[key].items():
+                merged[key][name] = merged[key].get(name, 0) + count
+    return merged
+
+
+def missing_percent(profile):
+    rows = max(profile["rows"], 1)
+    return {col: round(n / rows * 100, 2) for col, n in profile["missing_count"].items()}
+
+
+def empty_columns(profile):
+    rows = profile["rows"]
+    if not rows:
+        return []
+    return [col for col, n in profile["missing_count"].items() if n == rows]
+
+
+def save_profile(profile, path):
+    report = dict(profile)
+    report["missing_percent"] = missing_percent(profile)
+    report["empty_cols"] = empty_columns(profile)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+
+def load_profile(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def print_profile(profile):
+    print("\n==============================")
+    print("BASIC INFO")
+    print("==============================")
+    print("Rows:", profile["rows"])
+
+    print("\n==============================")
+    print("MISSING VALUES (COUNT)")
+    print("==============================")
+    print(pd.Series(profile["missing_count"], dtype="int64"))
+
+    print("\n==============================")
+    print("MISSING VALUES (%)")
+    print("==============================")
+    print(pd.Series(missing_percent(profile), dtype="float64"))
+
+    print("\n==============================")
+    print("COMPLETELY EMPTY COLUMNS")
+    print("==============================")
+    print(empty_columns(profile))
+
+    print("\n==============================")
+    print("INCONSISTENCY CHECKS")
+    print("==============================")
+    for name, count in profile["checks"].items():
+        print(f"{name}:", count)
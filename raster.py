@@ -0,0 +1,119 @@
+"""
+Rasterized density rendering of occurrence coordinates.
+
+Points are counted into a fixed-resolution longitude/latitude grid with
+``np.bincount`` and the counts are shaded into an RGBA image, so drawing
+cost and memory depend on the image size rather than the number of
+records, and dense areas stay readable instead of overplotting. The image
+is shown with ``imshow`` in the EDA script, in degrees, and as a static
+``ImageOverlay`` on the dashboard map, where its rows are binned on the
+Web Mercator y of the latitudes (``mercator=True``) to line up with the
+map's tiles.
+"""
+
+import numpy as np
+
+GLOBAL_EXTENT = (-180.0, 180.0, -90.0, 90.0)  # west, east, south, north
+MAP_EXTENT = (-180.0, 180.0, -85.0, 85.0)     # Web Mercator latitude limit
+
+DEFAULT_WIDTH = 1440
+DEFAULT_HEIGHT = 720
+
+CHUNK_ROWS = 1_000_000
+
+# Colormap stops from low to high density (dark red to pale yellow)
+DEFAULT_COLORS = ["#4a0505", "#8b0f0f", "#c8321e", "#ec6a2c", "#fbab3c", "#fde68a", "#fffde8"]
+
+
+def mercator_y(lat):
+    """Web Mercator y of latitudes in degrees (in earth radii)."""
+    return np.log(np.tan(np.pi / 4 + np.radians(lat) / 2))
+
+
+# Rows of a Web Mercator image of MAP_EXTENT with square pixels
+MAP_HEIGHT = int(round(DEFAULT_WIDTH * (mercator_y(MAP_EXTENT[3]) - mercator_y(MAP_EXTENT[2])) / (2 * np.pi)))
+
+
+def aggregate(lat, lon, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, extent=GLOBAL_EXTENT, mercator=False):
+    """
+    Count points per pixel. Returns a ``(height, width)`` int64 array with
+    the northernmost row first; points outside ``extent`` are ignored.
+    With ``mercator`` the rows are evenly spaced in Web Mercator y rather
+    than in latitude.
+    """
+    west, east, south, north = extent
+    top, bottom = (mercator_y(north), mercator_y(south)) if mercator else (north, south)
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    counts = np.zeros(width * height, dtype=np.int64)
+
+    # Chunked so temporaries stay bounded for very large inputs
+    for start in range(0, len(lat), CHUNK_ROWS):
+        y = lat[start:start + CHUNK_ROWS]
+        x = lon[start:start + CHUNK_ROWS]
+        inside = (y >= south) & (y <= north) & (x >= west) & (x <= east)
+        y, x = y[inside], x[inside]
+        if mercator:
+            y = mercator_y(y)
+        col = np.minimum(((x - west) / (east - west) * width).astype(np.int64), width - 1)
+        row = np.minimum(((top - y) / (top - bottom) * height).astype(np.int64), height - 1)
+        counts += np.bincount(row * width + col, minlength=width * height)
+
+    return counts.reshape(height, width)
+
+
+def _normalize(counts, how):
+    """Map non-zero counts to [0, 1]; empty pixels stay NaN."""
+    values = np.full(counts.shape, np.nan)
+    filled = counts > 0
+    if not filled.any():
+        return values
+    data = counts[filled].astype(np.float64)
+
+    if how == "eq_hist":
+        # Histogram equalization: each pixel's share of the non-empty pixels
+        # with a lower or equal count
+        levels, inverse, freq = np.unique(data, return_inverse=True, return_counts=True)
+        cdf = np.cumsum(freq) / data.size
+        low = cdf[0] if len(levels) > 1 else 0.0
+        scaled = (cdf[inverse] - low) / max(1.0 - low, 1e-12)
+    elif how == "log":
+        data = np.log1p(data)
+        low, high = data.min(), data.max()
+        scaled = (data - low) / (high - low) if high > low else np.ones_like(data)
+    elif how == "linear":
+        scaled = data / data.max()
+    else:
+        raise ValueError(f"Unknown shading: {how}")
+
+    values[filled] = scaled
+    return values
+
+
+def _colormap(colors):
+    stops = np.array([[int(c[i:i + 2], 16) for i in (1, 3, 5)] for c in colors], dtype=np.float64)
+    positions = np.linspace(0.0, 1.0, len(stops))
+    return positions, stops
+
+
+def shade(counts, how="eq_hist", colors=DEFAULT_COLORS, min_alpha=96):
+    """
+    Shade a count grid into an RGBA uint8 image. Empty pixels are fully
+    transparent; opacity rises with density from ``min_alpha`` to 255.
+    """
+    values = _normalize(counts, how)
+    filled = ~np.isnan(values)
+    positions, stops = _colormap(colors)
+
+    image = np.zeros(counts.shape + (4,), dtype=np.uint8)
+    v = values[filled]
+    for channel in range(3):
+        image[..., channel][filled] = np.interp(v, positions, stops[:, channel]).round()
+    image[..., 3][filled] = (min_alpha + (255 - min_alpha) * v).round()
+    return image
+
+
+def render(lat, lon, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, extent=GLOBAL_EXTENT,
+           how="eq_hist", colors=DEFAULT_COLORS, mercator=False):
+    """Aggregate and shade in one step."""
+    return shade(aggregate(lat, lon, width, height, extent, mercator), how, colors)
@@ -0,0 +1,143 @@
+"""
+Declarative validation rules for the cleaning and profiling steps.
+
+The thresholds and lists used by cleaning.py, profiling.py and
+schema_inference.py are read from a JSON file (``cleaning_rules.json`` by
+default), so they can be tuned per region without code changes. Each rule
+names a column and one condition:
+
+- ``min`` / ``max``: a numeric range (values are converted with to_numeric)
+- ``pattern``: a regular expression the text must match
+- ``blank``: the text must not be missing or one of ``blank_tokens``
+
+``filters`` decide which rows the cleaning keeps. All of them are
+evaluated into one rejection mask per chunk and the frame is filtered once;
+rows are kept only if no filter rejects them. Missing values are rejected
+unless the rule sets ``allow_missing``. Filters are grouped into named
+``stage``s, and the rows remaining after each stage are the same as when
+the stages are applied one after the other.
+
+``checks`` only count violating rows for the data-quality profile; for
+range and pattern checks missing values are not violations.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cleaning_rules.json")
+
+
+class Rule:
+    def __init__(self, name, column, min=None, max=None, pattern=None, blank=False,
+                 allow_missing=False, stage=None):
+        self.name = name
+        self.column = column
+        self.min = min
+        self.max = max
+        self.pattern = pattern
+        self.blank = blank
+        self.allow_missing = allow_missing
+        self.stage = stage or name
+
+    @property
+    def numeric(self):
+        return self.min is not None or self.max is not None
+
+    def violations(self, df, blank_tokens, missing_violates):
+        """Boolean array of the rows of ``df`` breaking the rule, or None if the column is absent."""
+        if self.column not in df.columns:
+            return None
+
+        if self.numeric:
+            values = pd.to_numeric(df[self.column], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+            missing = np.isnan(values)
+            bad = np.zeros(len(values), dtype=bool)
+            if self.min is not None:
+                bad |= values < self.min
+            if self.max is not None:
+                bad |= values > self.max
+            return bad | (missing & missing_violates)
+
+        # Text rules are evaluated once per distinct value
+        codes, uniques = pd.factorize(df[self.column])
+        uniques = pd.Index(uniques).astype(str)
+        if self.blank:
+            bad_values = uniques.str.strip().isin(blank_tokens)
+            missing_violates = True
+        else:
+            bad_values = ~uniques.str.match(self.pattern)
+        bad = np.asarray(bad_values, dtype=bool)[codes] if len(uniques) else np.zeros(len(codes), bool)
+        return np.where(codes < 0, missing_violates, bad)
+
+
+class RuleSet:
+    def __init__(self, config):
+        self.drop_columns = list(config.get("drop_columns", []))
+        self.keep_columns = list(config.get("keep_columns", []))
+        self.min_fill_fraction = float(config.get("min_fill_fraction", 0.0))
+        self.text_columns = list(config.get("text_columns", []))
+        self.blank_tokens = list(config.get("blank_tokens", []))
+        self.filters = [Rule(**rule) for rule in config.get("filters", [])]
+        self.checks = [Rule(**rule) for rule in config.get("checks", [])]
+
+    @property
+    def stages(self):
+        return list(dict.fromkeys(rule.stage for rule in self.filters))
+
+    def to_numeric(self, df):
+        """Convert the columns of the numeric filters to numbers in place."""
+        for col in dict.fromkeys(r.column for r in self.filters if r.numeric):
+            if col in df.columns:
+                df[col] = pd.to_numeric(df[col], errors="coerce")
+        return df
+
+    def apply(self, df, stages=None, rejected=None):
+        """
+        Keep the rows of ``df`` no filter rejects, filtering the frame once.
+
+        Adds the rows remaining after each stage to ``stages`` and the rows
+        each filter rejects (whether or not another filter also does) to
+        ``rejected``, when they are dicts.
+        """
+        keep = np.ones(len(df), dtype=bool)
+        for stage in self.stages:
+            for rule in self.filters:
+                if rule.stage != stage:
+                    continue
+                bad = rule.violations(df, self.blank_tokens, not rule.allow_missing)
+                if bad is None:
+                    continue
+                keep &= ~bad
+                if rejected is not None:
+                    rejected[rule.name] = rejected.get(rule.name, 0) + int(bad.sum())
+            if stages is not None:
+                stages[stage] = stages.get(stage, 0) + int(keep.sum())
+        return df[keep]
+
+    def check_counts(self, df):
+        """Violating rows per check, for the checks whose column ``df`` has."""
+        counts = {}
+        for rule in self.checks:
+            bad = rule.violations(df, self.blank_tokens, missing_violates=False)
+            if bad is not None:
+                counts[rule.name] = int(bad.sum())
+        return counts
+
+
+def load_rules(path=DEFAULT_RULES_PATH):
+    with open(path, encoding="utf-8") as f:
+        return RuleSet(json.load(f))
+
+
+_default_rules = None
+
+
+def default_rules():
+    """The rules in ``cleaning_rules.json``, loaded once per process."""
+    global _default_rules
+    if _default_rules is None:
+        _default_rules = load_rules()
+    return _default_rules
@@ -0,0 +1,151 @@
+"""
+Column pruning and type narrowing for the cleaned dataset.
+
+``column_stats`` summarises each column of a cleaned chunk (null count and,
+for numeric data, range and integrality); the summaries of all chunks are
+merged with ``merge_stats`` as the chunks stream past. ``infer_schema`` then
+
+- drops columns that are empty or populated in fewer than
+  ``min_fill_fraction`` of the rows (except the ``keep_columns`` of the
+  rules file), and
+- narrows numeric types: integers to the smallest type holding the
+  observed values, but no narrower than int32 unless the column's range
+  is fixed (``DOMAIN_COLUMNS``), and other floats to float32.
+
+The result is written next to the cleaned CSV as ``<name>.schema.json``
+and used by convert_data.py and snapshots.load_cleaned, so the dropped
+columns are never loaded and the kept ones take less memory.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from convert_data import GBIF_SCHEMA, type_name
+from rules import default_rules
+
+INT_TYPES = [("int8", np.int8), ("int16", np.int16), ("int32", np.int32), ("int64", np.int64)]
+NUMERIC_TYPES = {name for name, _ in INT_TYPES} | {"float32", "float64"}
+
+# Identifiers keep their declared width: later downloads bring larger ids
+ID_COLUMNS = ["gbifID", "speciesKey"]
+
+# Integer columns whose values have a fixed range, so the observed one can
+# be narrowed to; open-ended ones (counts, ...) keep at least int32 for the
+# values later downloads bring (see ingest.py)
+DOMAIN_COLUMNS = ["year", "month", "day"]
+MIN_OPEN_INT_TYPE = "int32"
+
+
+def _numeric_values(series):
+    """``series`` as float64 if every non-null value is a number, else None."""
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_datetime64_any_dtype(series):
+        return None
+    if pd.api.types.is_numeric_dtype(series):
+        return series.to_numpy(dtype=np.float64, na_value=np.nan)
+
+    # Text: each distinct value is converted once
+    codes, uniques = pd.factorize(series)
+    numbers = pd.to_numeric(pd.Series(uniques, dtype=object), errors="coerce").to_numpy(dtype=np.float64)
+    if np.isnan(numbers).any():
+        return None
+    return np.where(codes < 0, np.nan, numbers[codes] if len(numbers) else np.nan)
+
+
+def column_stats(df):
+    """Null count, and numeric range and integrality, of each column of ``df``."""
+    stats = {}
+    nulls = df.isna().sum()
+    for col in df.columns:
+        entry = {"rows": len(df), "nulls": int(nulls[col]), "numeric": False}
+        values = _numeric_values(df[col])
+        if values is not None:
+            present = values[~np.isnan(values)]
+            entry["numeric"] = True
+            entry["integer"] = bool(np.all(present == np.floor(present)))
+            entry["min"] = float(present.min()) if len(present) else None
+            entry["max"] = float(present.max()) if len(present) else None
+        stats[col] = entry
+    return stats
+
+
+def merge_stats(stats_list):
+    """Combine the column stats of consecutive chunks."""
+    merged = {}
+    for stats in stats_list:
+        for col, entry in stats.items():
+            if col not in merged:
+                merged[col] = dict(entry)
+                continue
+            total = merged[col]
+            total["rows"] += entry["rows"]
+            total["nulls"] += entry["nulls"]
+            total["numeric"] = total["numeric"] and entry["numeric"]
+            if total["numeric"]:
+                total["integer"] = total["integer"] and entry["integer"]
+                lows = [v for v in (total["min"], entry["min"]) if v is not None]
+                highs = [v for v in (total["max"], entry["max"]) if v is not None]
+                total["min"] = min(lows) if lows else None
+                total["max"] = max(highs) if highs else None
+    return merged
+
+
+def _narrow(col, entry, declared):
+    """Smallest type for column ``col`` with stats ``entry`` and GBIF type ``declared``."""
+    if not entry["numeric"] or entry["min"] is None or col in ID_COLUMNS:
+        return declared or "string"
+    if declared is not None and declared not in NUMERIC_TYPES:
+        return declared
+
+    if entry["integer"] and declared not in ("float32", "float64"):
+        int_types = INT_TYPES
+        if col not in DOMAIN_COLUMNS:
+            int_types = INT_TYPES[[name for name, _ in INT_TYPES].index(MIN_OPEN_INT_TYPE):]
+        for name, int_type in int_types:
+            info = np.iinfo(int_type)
+            if info.min <= entry["min"] and entry["max"] <= info.max:
+                return name
+    return "float32"
+
+
+def infer_schema(stats, rules=None):
+    """
+    The columns to keep and their types, as a JSON-friendly dict:
+    ``{"columns": [{"name", "type"}, ...], "dropped": [...]}``.
+    """
+    rules = rules or default_rules()
+    columns, dropped = [], []
+    for col, entry in stats.items():
+        filled = entry["rows"] - entry["nulls"]
+        if col not in rules.keep_columns and filled <= rules.min_fill_fraction * entry["rows"]:
+            dropped.append(col)
+            continue
+
+        idx = GBIF_SCHEMA.get_field_index(col)
+        declared = type_name(GBIF_SCHEMA.field(idx).type) if idx >= 0 else None
+        columns.append({"name": col, "type": _narrow(col, entry, declared)})
+    return {"columns": columns, "dropped": dropped}
+
+
+def schema_path(csv_path):
+    return os.path.splitext(csv_path)[0] + ".schema.json"
+
+
+def save_schema(schema, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(schema, f, indent=2)
+
+
+def load_schema(path):
+    """The schema saved at ``path``, or ``None`` if there is none."""
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def prune_columns(df, schema):
+    """``df`` without the columns the schema drops."""
+    return df[[c["name"] for c in schema["columns"] if c["name"] in df.columns]]
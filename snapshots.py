@@ -0,0 +1,279 @@
+"""
+CSV loading with a cached binary snapshot, shared by the EDA and cleaning
+scripts.
+
+The first ``load_csv`` of a file parses it once and stores the result as an
+uncompressed Arrow IPC (Feather v2) file next to it, under ``.snapshots/``.
+The CSV is parsed in chunks that are written out as they come, so the whole
+parsed file is never held in memory next to its snapshot. The snapshot name
+holds the source's size and modification time, so editing or replacing the
+CSV invalidates it. Every load, the first included, memory-maps the snapshot
+and builds the DataFrame from the mapped buffers.
+"""
+
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
+
+SNAPSHOT_DIR = ".snapshots"
+
+CHUNK_ROWS = 250_000  # CSV rows parsed at a time on a first load
+
+# Explicit dtypes for gbif_cleaned.csv
+CLEANED_DTYPES = {
+    "gbifID": "Int64",
+    "kingdom": "category",
+    "phylum": "category",
+    "class": "category",
+    "order": "category",
+    "family": "category",
+    "genus": "category",
+    "species": "category",
+    "countryCode": "category",
+    "stateProvince": "category",
+    "basisOfRecord": "category",
+    "mediaType": "category",
+    "decimalLatitude": "float32",
+    "decimalLongitude": "float32",
+    "coordinateUncertaintyInMeters": "float32",
+    "year": "Int16",
+    "month": "Int8",
+    "day": "Int8",
+    "speciesKey": "float64",
+    "speciesKey_missing": "boolean",
+}
+
+
+# Pandas dtypes for the column types of a .schema.json file
+# (see schema_inference.py)
+SCHEMA_DTYPES = {
+    "bool": "boolean",
+    "int8": "Int8",
+    "int16": "Int16",
+    "int32": "Int32",
+    "int64": "Int64",
+    "float32": "float32",
+    "float64": "float64",
+    "dictionary": "category",
+}
+
+
+def fingerprint(path):
+    """Cheap identity of a file's current contents: size and mtime."""
+    st = os.stat(path)
+    return f"{st.st_size}-{st.st_mtime_ns}"
+
+
+def snapshot_path(path, variant=""):
+    directory = os.path.join(os.path.dirname(os.path.abspath(path)), SNAPSHOT_DIR)
+    tag = hashlib.md5(variant.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(directory, f"{os.path.basename(path)}.{tag}.{fingerprint(path)}.arrow")
+
+
+def write_snapshot(table, out_path):
+    """Write ``table`` as an uncompressed IPC file, atomically."""
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    try:
+        with pa.OSFile(tmp_path, "wb") as sink, ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    except OSError:
+        # e.g. the disk is full: leave no partial file behind
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, out_path)
+
+
+def read_snapshot(snap_path):
+    """Memory-map an IPC file; the returned table references the mapped pages."""
+    with pa.memory_map(snap_path, "r") as source:
+        return ipc.open_file(source).read_all()
+
+
+def write_arrays(arrays, out_path):
+    """
+    Write named 1-D numpy arrays of any lengths as one IPC file: a single
+    row with one list column per array.
+    """
+    columns = {}
+    for name, values in arrays.items():
+        values = pa.array(values)
+        columns[name] = pa.LargeListArray.from_arrays(pa.array([0, len(values)], pa.int64()), values)
+    write_snapshot(pa.table(columns), out_path)
+
+
+def read_arrays(snap_path):
+    """
+    The arrays of a ``write_arrays`` file. Numeric arrays are read-only
+    views of the mapped pages; text arrays are copied into object arrays.
+    """
+    table = read_snapshot(snap_path)
+    return {
+        name: table[name].chunk(0).values.to_numpy(zero_copy_only=False)
+        for name in table.column_names
+    }
+
+
+def _remove_stale(snap_path):
+    # Older snapshots of the same file and variant (other fingerprints)
+    prefix = snap_path.rsplit(".", 2)[0]
+    for old in glob.glob(glob.escape(prefix) + ".*.arrow"):
+        if old != snap_path:
+            try:
+                os.remove(old)
+            except OSError:
+                # Still mapped by another process (Windows)
+                pass
+
+
+def _common_schema(tables):
+    """
+    The schema all chunks can be cast to (integers widen to floats where
+    another chunk has missing values, and so on), and the columns whose
+    types have none in common, such as numbers in some chunks and text in
+    others.
+    """
+    fields, conflicts = [], []
+    for i, name in enumerate(tables[0].column_names):
+        columns = [table.column(i) for table in tables]
+        # A chunk where the column is empty says nothing of its type
+        types = [c.type for c in columns if c.null_count < len(c)] or [columns[0].type]
+        try:
+            fields.append(pa.unify_schemas(
+                [pa.schema([(name, t)]) for t in types], promote_options="permissive"
+            ).field(0))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            conflicts.append(name)
+    return pa.schema(fields, metadata=tables[0].schema.metadata), conflicts
+
+
+def _cast(table, schema):
+    return pa.table([
+        pa.nulls(len(column), field.type) if column.null_count == len(column) else column.cast(field.type)
+        for column, field in zip(table.columns, schema)
+    ], schema=schema)
+
+
+def _unify_dictionaries(table):
+    """
+    ``table.unify_dictionaries()``, with the categories sorted as a single
+    ``read_csv`` sorts them. Columns whose chunks all have the same
+    categories (e.g. from an explicit CategoricalDtype) keep their order.
+    """
+    inferred = [
+        i for i, column in enumerate(table.columns)
+        if pa.types.is_dictionary(column.type)
+        and len({tuple(chunk.dictionary.to_pylist()) for chunk in column.chunks}) > 1
+    ]
+    table = table.unify_dictionaries()
+    for i in inferred:
+        column = table.column(i)
+        dictionary = column.chunk(0).dictionary
+        order = pc.array_sort_indices(dictionary).to_numpy()
+        rank = np.empty(len(order), dtype=column.type.index_type.to_pandas_dtype())
+        rank[order] = np.arange(len(order))
+        chunks = [
+            pa.DictionaryArray.from_arrays(pc.take(rank, chunk.indices), dictionary.take(order))
+            for chunk in column.chunks
+        ]
+        table = table.set_column(i, table.field(i), pa.chunked_array(chunks, column.type))
+    return table
+
+
+def _spill_chunks(path, dtype, read_csv_kwargs, prefix, parts):
+    """Write each parsed chunk of the CSV to its own IPC file, listed in ``parts``."""
+    with pd.read_csv(path, dtype=dtype, chunksize=CHUNK_ROWS, low_memory=False, **read_csv_kwargs) as reader:
+        for i, chunk in enumerate(reader):
+            parts.append(f"{prefix}.{i}.part")
+            write_snapshot(pa.Table.from_pandas(chunk, preserve_index=False), parts[-1])
+
+
+def _merge_parts(parts, out_path):
+    """
+    Cast the chunks spilled to ``parts`` to their common schema and write
+    them to ``out_path`` as one file. Returns the columns with no common
+    type instead, without writing anything, if there are any.
+    """
+    # The parts are memory-mapped, so only the cast columns are copied
+    tables = [read_snapshot(part) for part in parts]
+    schema, conflicts = _common_schema(tables)
+    if conflicts:
+        return conflicts
+    tables = [_cast(table, schema) for table in tables]
+    write_snapshot(_unify_dictionaries(pa.concat_tables(tables)), out_path)
+    return []
+
+
+def _write_streamed(path, out_path, dtype, read_csv_kwargs):
+    """
+    Parse the CSV at ``path`` chunk by chunk into one snapshot. The chunks
+    are spilled to IPC files, then cast to their common types and written
+    out as one file. Columns with no common type are parsed again as text,
+    as a single ``read_csv`` of the whole file reads them.
+    """
+    dtype = dict(dtype or {})
+    prefix = f"{out_path}.{os.getpid()}"
+    parts = []
+    try:
+        while True:
+            _spill_chunks(path, dtype, read_csv_kwargs, prefix, parts)
+            conflicts = _merge_parts(parts, out_path)
+            if not conflicts:
+                break
+            for part in parts:
+                os.remove(part)
+            parts = []
+            dtype.update({col: "str" for col in conflicts})
+    finally:
+        for part in parts:
+            if os.path.exists(part):
+                os.remove(part)
+
+
+def load_csv(path, dtype=None, **read_csv_kwargs):
+    """
+    ``pd.read_csv(path, dtype=dtype, ...)`` through the snapshot cache.
+
+    Numeric columns without missing values are handed back without copying
+    the mapped buffers.
+    """
+    variant = repr((sorted((dtype or {}).items()), sorted(read_csv_kwargs.items())))
+    snap_path = snapshot_path(path, variant)
+
+    if os.path.exists(snap_path):
+        return read_snapshot(snap_path).to_pandas(split_blocks=True)
+
+    # Columns named in dtype but missing from this file are ignored
+    if dtype:
+        header = pd.read_csv(path, nrows=0, **read_csv_kwargs).columns
+        dtype = {col: t for col, t in dtype.items() if col in header}
+
+    _remove_stale(snap_path)
+    _write_streamed(path, snap_path, dtype, read_csv_kwargs)
+    return read_snapshot(snap_path).to_pandas(split_blocks=True)
+
+
+def load_cleaned(path):
+    """
+    Load gbif_cleaned.csv with the explicit cleaned-data dtypes. If the
+    cleaning step saved a schema next to it, only the columns it keeps are
+    read, with its narrowed types.
+    """
+    schema_file = os.path.splitext(path)[0] + ".schema.json"
+    if not os.path.exists(schema_file):
+        return load_csv(path, dtype=CLEANED_DTYPES)
+
+    with open(schema_file, encoding="utf-8") as f:
+        columns = json.load(f)["columns"]
+    names = [c["name"] for c in columns]
+    dtype = {col: t for col, t in CLEANED_DTYPES.items() if col in names}
+    dtype.update({c["name"]: SCHEMA_DTYPES[c["type"]] for c in columns if c["type"] in SCHEMA_DTYPES})
+    return load_csv(path, dtype=dtype, usecols=names)
@@ -0,0 +1,171 @@
+"""
+Spatial aggregation of occurrence coordinates for the map.
+
+``bin_points`` snaps coordinates onto a regular lat/lon grid whose cell size
+follows the map zoom level, and returns one weighted centroid per occupied
+cell. The grid is coarsened until the number of cells fits ``max_cells``, so
+the payload sent to the browser is bounded whatever the number of records.
+
+``GridIndex`` is a sorted lat/lon grid over all loaded points, used to find
+the points inside the map's current viewport without scanning every row.
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MAX_CELLS = 20_000
+
+# Cell edge in screen pixels at the requested zoom (a 256 px tile spans
+# 360 degrees of longitude at zoom 0)
+CELL_PIXELS = 8
+
+
+def cell_size(zoom):
+    """Grid cell edge, in degrees, for a web-map zoom level."""
+    return 360.0 / (256 * 2 ** zoom) * CELL_PIXELS
+
+
+# Grids up to this many cells are counted with a dense bincount (linear
+# time); finer grids fall back to sorting the occupied cell keys.
+DENSE_GRID_LIMIT = 4_000_000
+
+
+def _cell_keys(lat, lon, size):
+    n_rows = int(math.ceil(180.0 / size)) + 1
+    n_cols = int(math.ceil(360.0 / size)) + 1
+    rows = np.floor((lat + 90.0) / size).astype(np.int64)
+    cols = np.floor((lon + 180.0) / size).astype(np.int64)
+    return rows * n_cols + cols, n_rows * n_cols
+
+
+def _group(keys, n_grid):
+    """Occupied cell count, each point's cell slot, and points per cell."""
+    if n_grid <= DENSE_GRID_LIMIT:
+        counts = np.bincount(keys, minlength=n_grid)
+        occupied = counts > 0
+        slots = np.cumsum(occupied) - 1
+        return int(occupied.sum()), slots[keys], counts[occupied]
+    cells, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    return len(cells), inverse, counts
+
+
+def bin_points(lat, lon, zoom, max_cells=DEFAULT_MAX_CELLS):
+    """
+    Weighted cell centroids of the points (``lat``, ``lon``).
+
+    Returns a DataFrame with ``lat``, ``lon`` (mean position of the points in
+    each cell) and ``weight`` (number of points). When there are no more
+    points than ``max_cells`` they are returned as they are, with weight 1.
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    valid = np.isfinite(lat) & np.isfinite(lon)
+    if not valid.all():
+        lat, lon = lat[valid], lon[valid]
+
+    if len(lat) <= max_cells:
+        return pd.DataFrame({"lat": lat, "lon": lon, "weight": np.ones(len(lat), dtype=np.int64)})
+
+    zoom = max(int(zoom), 0)
+    while True:
+        n_cells, inverse, counts = _group(*_cell_keys(lat, lon, cell_size(zoom)))
+        if n_cells <= max_cells or zoom == 0:
+            break
+        # Each zoom step down merges up to 4 cells into one
+        zoom = max(zoom - max(int(math.ceil(math.log(n_cells / max_cells, 4))), 1), 0)
+
+    return pd.DataFrame({
+        "lat": np.bincount(inverse, weights=lat) / counts,
+        "lon": np.bincount(inverse, weights=lon) / counts,
+        "weight": counts,
+    })
+
+
+class GridIndex:
+    """
+    Row positions sorted by fixed-size grid cell.
+
+    Cells are numbered row-major (latitude band, then longitude), so the
+    cells of one latitude band that overlap a longitude range hold one
+    contiguous slice of ``order``. A bounding-box query reads one slice per
+    latitude band and then checks the exact bounds on those candidates only.
+
+    ``lat`` and ``lon`` are used as they are (not copied), and the index
+    converts to and from named arrays like ``filter_index.FilterIndex``.
+    """
+
+    def __init__(self, lat, lon, cell_deg=1.0):
+        self._set_grid(lat, lon, cell_deg)
+        lat = self.lat.astype(np.float64)
+        lon = self.lon.astype(np.float64)
+
+        n_cells = self.n_rows * self.n_cols
+        valid = np.isfinite(lat) & np.isfinite(lon) & (np.abs(lat) <= 90) & (np.abs(lon) <= 180)
+        keys, _ = _cell_keys(np.where(valid, lat, 0.0), np.where(valid, lon, 0.0), cell_deg)
+        # Points without usable coordinates sort after every cell
+        keys = np.where(valid, keys, n_cells)
+
+        self.order = np.argsort(keys, kind="stable")
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(keys, minlength=n_cells + 1))])
+
+    def _set_grid(self, lat, lon, cell_deg):
+        self.lat = np.asarray(lat)
+        self.lon = np.asarray(lon)
+        self.cell_deg = cell_deg
+        self.n_rows = int(math.ceil(180.0 / cell_deg)) + 1
+        self.n_cols = int(math.ceil(360.0 / cell_deg)) + 1
+
+    def arrays(self):
+        """The index (without the coordinates) as named arrays, for ``from_arrays``."""
+        return {"cell_deg": np.array([self.cell_deg]), "order": self.order, "offsets": self.offsets}
+
+    @classmethod
+    def from_arrays(cls, arrays, lat, lon):
+        index = cls.__new__(cls)
+        index._set_grid(lat, lon, float(arrays["cell_deg"][0]))
+        index.order = arrays["order"]
+        index.offsets = arrays["offsets"]
+        return index
+
+    def _lon_ranges(self, west, east):
+        if east - west >= 360:
+            return [(-180.0, 180.0)]
+        # Leaflet reports unwrapped longitudes once the map is panned past
+        # the antimeridian; wrap them and split the range if it crosses it
+        width = (east - west) % 360.0
+        west = (west + 180.0) % 360.0 - 180.0
+        east = west + width
+        if east <= 180.0:
+            return [(west, east)]
+        return [(west, 180.0), (-180.0, east - 360.0)]
+
+    def query(self, south, west, north, east):
+        """Sorted row positions of the points inside the bounding box."""
+        south, north = max(south, -90.0), min(north, 90.0)
+        if south > north:
+            return np.empty(0, dtype=np.int64)
+
+        band_lo = int((south + 90.0) // self.cell_deg)
+        band_hi = int((north + 90.0) // self.cell_deg)
+        bands = np.arange(band_lo, band_hi + 1, dtype=np.int64)
+
+        parts = []
+        lon_ranges = self._lon_ranges(west, east)
+        for lo, hi in lon_ranges:
+            col_lo = int((lo + 180.0) // self.cell_deg)
+            col_hi = min(int((hi + 180.0) // self.cell_deg), self.n_cols - 1)
+            starts = self.offsets[bands * self.n_cols + col_lo]
+            ends = self.offsets[bands * self.n_cols + col_hi + 1]
+            parts.extend(self.order[s:e] for s, e in zip(starts, ends) if e > s)
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+
+        rows = np.concatenate(parts)
+        lat, lon = self.lat[rows], self.lon[rows]
+        inside_lon = np.zeros(len(rows), dtype=bool)
+        for lo, hi in lon_ranges:
+            inside_lon |= (lon >= lo) & (lon <= hi)
+        rows = rows[inside_lon & (lat >= south) & (lat <= north)]
+        return np.sort(rows)
@@ -0,0 +1,141 @@
+"""
+Species name index for the dashboard's species search.
+
+``SpeciesIndex`` is built once from the ``species`` column when the data is
+loaded. Names are compared case-insensitively, and
+
+- prefix lookups binary-search the sorted lowercased names,
+- typo-tolerant lookups score names by the trigrams they share with the
+  query, through an inverted trigram -> names index, and
+- the rows of a name come from a posting list (see filter_index.py),
+
+so a query never scans the occurrence rows. Like ``FilterIndex``, the
+index converts to and from named arrays for sharing between processes.
+"""
+
+import numpy as np
+import pandas as pd
+
+from filter_index import _factorize, _Postings
+
+DEFAULT_LIMIT = 20
+
+# Smallest Dice similarity of the trigram sets for a fuzzy match
+MIN_SIMILARITY = 0.5
+
+
+def _trigrams(text):
+    # Padded so the first letters of each word weigh more than the rest
+    padded = "  " + " ".join(text.split()) + " "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SpeciesIndex:
+    def __init__(self, series):
+        codes, uniques = _factorize(series)
+        lower = pd.Series(uniques, dtype=object).str.lower()
+        lower_codes, keys = pd.factorize(lower, sort=True)
+        codes = np.where(codes >= 0, lower_codes[np.maximum(codes, 0)], -1)
+        self._postings = _Postings(codes, np.asarray(keys, dtype=object))
+
+        # Sorted lowercased names; each is shown as its first spelling
+        self.keys = self._postings.values
+        self._spellings = {}
+        for name, key in zip(uniques.tolist(), lower.tolist()):
+            self._spellings.setdefault(key, []).append(name)
+        self.names = [self._spellings[key][0] for key in self.keys.tolist()]
+
+        # Inverted trigram index: the names holding each trigram are one
+        # slice of _gram_owners
+        grams, owners = [], []
+        self._gram_counts = np.zeros(len(self.keys), dtype=np.int64)
+        for i, key in enumerate(self.keys.tolist()):
+            key_grams = _trigrams(key)
+            grams.extend(key_grams)
+            owners.extend([i] * len(key_grams))
+            self._gram_counts[i] = len(key_grams)
+        gram_codes, gram_values = pd.factorize(pd.Series(grams, dtype=object))
+        order = np.argsort(gram_codes, kind="stable")
+        self._gram_owners = np.asarray(owners, dtype=np.int64)[order]
+        self._gram_offsets = np.concatenate([[0], np.cumsum(np.bincount(gram_codes, minlength=len(gram_values)))])
+        self._gram_lookup = {g: i for i, g in enumerate(gram_values.tolist())}
+
+    def arrays(self):
+        """The index as named arrays, for ``from_arrays``."""
+        arrays = {f"postings.{key}": values for key, values in self._postings.arrays().items()}
+        spelling_keys = [key for key, names in self._spellings.items() for _ in names]
+        spellings = [name for names in self._spellings.values() for name in names]
+        arrays.update({
+            "names": np.asarray(self.names, dtype=object),
+            "spelling_keys": np.asarray(spelling_keys, dtype=object),
+            "spellings": np.asarray(spellings, dtype=object),
+            "gram_values": np.asarray(list(self._gram_lookup), dtype=object),
+            "gram_owners": self._gram_owners,
+            "gram_offsets": self._gram_offsets,
+            "gram_counts": self._gram_counts,
+        })
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        index = cls.__new__(cls)
+        index._postings = _Postings.from_arrays(
+            {name.split(".", 1)[1]: values for name, values in arrays.items() if name.startswith("postings.")}
+        )
+        index.keys = index._postings.values
+        index.names = arrays["names"].tolist()
+        index._spellings = {}
+        for key, name in zip(arrays["spelling_keys"].tolist(), arrays["spellings"].tolist()):
+            index._spellings.setdefault(key, []).append(name)
+        index._gram_owners = arrays["gram_owners"]
+        index._gram_offsets = arrays["gram_offsets"]
+        index._gram_counts = arrays["gram_counts"]
+        index._gram_lookup = {g: i for i, g in enumerate(arrays["gram_values"].tolist())}
+        return index
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _prefix(self, key):
+        lo = np.searchsorted(self.keys, key, side="left")
+        hi = np.searchsorted(self.keys, key + "\U0010ffff", side="left")
+        return np.arange(lo, hi)
+
+    def _fuzzy(self, key, min_similarity):
+        query_grams = [self._gram_lookup[g] for g in _trigrams(key) if g in self._gram_lookup]
+        if not query_grams:
+            return np.empty(0, dtype=np.int64)
+        owners = np.concatenate([
+            self._gram_owners[self._gram_offsets[g]:self._gram_offsets[g + 1]] for g in query_grams
+        ])
+        candidates, shared = np.unique(owners, return_counts=True)
+        similarity = 2 * shared / (len(_trigrams(key)) + self._gram_counts[candidates])
+        keep = similarity >= min_similarity
+        candidates, similarity = candidates[keep], similarity[keep]
+        # Best first; equal scores in name order
+        return candidates[np.lexsort((candidates, -similarity))]
+
+    def search(self, query, limit=DEFAULT_LIMIT, min_similarity=MIN_SIMILARITY):
+        """
+        Up to ``limit`` names matching ``query``: the exact match, then names
+        starting with it (alphabetically), then similar names (best first).
+        """
+        key = " ".join(query.lower().split())
+        if not key:
+            return []
+        found = dict.fromkeys(self._prefix(key)[:limit].tolist())
+        if len(found) < limit:
+            for i in self._fuzzy(key, min_similarity).tolist():
+                found.setdefault(i)
+                if len(found) == limit:
+                    break
+        # The prefix range starts with the exact match, if there is one
+        return [self.names[i] for i in found]
+
+    def spellings(self, name):
+        """Every spelling of ``name`` in the data (case variants)."""
+        return list(self._spellings.get(name.lower(), []))
+
+    def rows(self, name):
+        """Sorted row positions of ``name``, in any case."""
+        return self._postings.rows(self._postings.codes_for([name.lower()]))
@@ -0,0 +1,102 @@
+"""
+Taxonomy distributions for every rank from one pass over the occurrences.
+
+``TaxonomyCounts`` factorizes each rank column of the kingdom → species
+hierarchy into integer codes once, then collapses the occurrences into their
+distinct taxonomic paths with a single vectorized group-count. Counts for
+any rank, and parent/child rollups between ranks, are then sums over those
+paths, whose number is bounded by the number of species rather than the
+number of records.
+"""
+
+import sys
+
+import numpy as np
+import pandas as pd
+
+TAXONOMY_RANKS = ["kingdom", "phylum", "class", "order", "family", "genus", "species"]
+
+
+def _path_keys(codes, cardinalities):
+    """Mixed-radix key per row (missing codes shifted to 0), or None on overflow."""
+    radices = [c + 1 for c in cardinalities]
+    if np.prod([float(r) for r in radices]) >= 2.0 ** 62:
+        return None
+    keys = np.zeros(len(codes[0]) if codes else 0, dtype=np.int64)
+    for col, radix in zip(codes, radices):
+        keys = keys * radix + (col + 1)
+    return keys
+
+
+class TaxonomyCounts:
+    def __init__(self, df, ranks=TAXONOMY_RANKS):
+        self.ranks = [r for r in ranks if r in df.columns]
+        self.rows = len(df)
+
+        codes, self.values = [], {}
+        for rank in self.ranks:
+            rank_codes, uniques = pd.factorize(df[rank])
+            codes.append(rank_codes.astype(np.int64))
+            self.values[rank] = np.asarray(uniques, dtype=object)
+
+        # One group-count over all ranks: the distinct paths and their sizes
+        keys = _path_keys(codes, [len(self.values[r]) for r in self.ranks])
+        if keys is not None:
+            _, first, counts = np.unique(keys, return_index=True, return_counts=True)
+            paths = np.column_stack([c[first] for c in codes]) if codes else np.empty((0, 0), np.int64)
+        else:
+            matrix = np.column_stack(codes)
+            paths, counts = np.unique(matrix, axis=0, return_counts=True)
+
+        self.paths = pd.DataFrame(paths, columns=self.ranks)
+        self.path_counts = counts.astype(np.int64)
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the counts, in bytes."""
+        values = sum(v.nbytes + sum(map(sys.getsizeof, v.tolist())) for v in self.values.values())
+        return int(self.paths.memory_usage(index=True).sum()) + self.path_counts.nbytes + values
+
+    def counts(self, rank, dropna=True):
+        """Records per value of ``rank``, most frequent first (like value_counts)."""
+        codes = self.paths[rank].to_numpy()
+        present = codes >= 0
+        totals = np.bincount(codes[present], weights=self.path_counts[present],
+                             minlength=len(self.values[rank])).astype(np.int64)
+        counts = pd.Series(totals, index=pd.Index(self.values[rank], name=rank), name="count")
+        if not dropna:
+            missing = int(self.path_counts[~present].sum())
+            if missing:
+                counts = pd.concat([counts, pd.Series([missing], index=pd.Index([np.nan], name=rank), name="count")])
+        return counts[counts > 0].sort_values(ascending=False, kind="stable")
+
+    def total(self, rank):
+        """Records with a value at ``rank``."""
+        return int(self.path_counts[self.paths[rank].to_numpy() >= 0].sum())
+
+    def distinct(self, rank):
+        """Number of distinct values of ``rank`` (like nunique)."""
+        codes = self.paths[rank].to_numpy()
+        return int(np.unique(codes[codes >= 0]).size)
+
+    def rollup(self, parent, child):
+        """Records per (parent, child) pair, e.g. orders within each class."""
+        pairs = self.paths[[parent, child]].assign(count=self.path_counts)
+        pairs = pairs[(pairs[parent] >= 0) & (pairs[child] >= 0)]
+        grouped = pairs.groupby([parent, child], sort=False)["count"].sum().reset_index()
+        grouped[parent] = self.values[parent][grouped[parent].to_numpy()]
+        grouped[child] = self.values[child][grouped[child].to_numpy()]
+        return grouped.sort_values("count", ascending=False, kind="stable", ignore_index=True)
+
+    def children(self, rank, value):
+        """Records per taxon one rank below ``value``."""
+        child = self.ranks[self.ranks.index(rank) + 1]
+        pairs = self.rollup(rank, child)
+        return pairs.loc[pairs[rank] == value].set_index(child)["count"]
+
+    def top_values(self, rank, n=10):
+        """The ``n`` most frequent values of ``rank``, missing values as "Unknown"."""
+        counts = self.counts(rank, dropna=False)
+        counts = counts.groupby(counts.index.fillna("Unknown"), sort=False).sum()
+        counts = counts.sort_values(ascending=False, kind="stable").head(n)
+        return pd.DataFrame({"value": counts.index, "count": counts.to_numpy()})
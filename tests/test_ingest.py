@@ -0,0 +1,75 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import convert_data
+import ingest
+import snapshots
+from benchmarks.synthetic import Generator, write_raw_csv
+from cleaning import run_cleaning
+from schema_inference import save_schema, schema_path
+
+
+def _pruned_cleaned_csv(tmp_path):
+    # As the batch cell of GBIF_Data_Cleaning.py writes it: only the
+    # columns kept by the schema
+    raw_path = str(tmp_path / "raw.csv")
+    clean_path = str(tmp_path / "gbif_cleaned.csv")
+    write_raw_csv(3000, raw_path, seed=1)
+    report = run_cleaning(raw_path, clean_path, chunksize=1000, force=True)
+    df = snapshots.load_cleaned(clean_path)
+    df.to_csv(clean_path, index=False)
+    save_schema(report["schema"], schema_path(clean_path))
+    return clean_path, df
+
+
+def _download(tmp_path, n_rows):
+    # New ids, columns in another order, and a count the dataset's
+    # narrowed type cannot hold
+    df = Generator(n_rows, seed=2).chunk(0, n_rows)
+    df["gbifID"] = np.arange(n_rows) + 2_000_000_000
+    df["occurrenceID"] = [f"urn:catalog:test:{i}" for i in range(n_rows)]
+    df.loc[df.index[::10], "individualCount"] = 3_000_000_000
+    path = str(tmp_path / "download.csv")
+    df[df.columns[::-1]].to_csv(path, index=False)
+    return path
+
+
+def test_ingest_appends_to_pruned_csv(tmp_path):
+    clean_path, before = _pruned_cleaned_csv(tmp_path)
+    header = list(pd.read_csv(clean_path, nrows=0).columns)
+    data_path = str(tmp_path / "gbif_cleaned.parquet")
+    convert_data.convert_csv_to_parquet(clean_path, data_path)
+
+    report = ingest.ingest(_download(tmp_path, 500), data_path, str(tmp_path / "cube.parquet"), clean_path)
+    assert report["rows_out"] > 0
+
+    assert list(pd.read_csv(clean_path, nrows=0).columns) == header
+    after = snapshots.load_cleaned(clean_path)
+    assert list(after.columns) == list(before.columns)
+    assert len(after) == len(before) + report["rows_out"]
+    assert after["gbifID"].iloc[len(before):].min() >= 2_000_000_000
+    assert after["individualCount"].max() == 3_000_000_000
+
+    with open(schema_path(clean_path), encoding="utf-8") as f:
+        types = {c["name"]: c["type"] for c in json.load(f)["columns"]}
+    assert types["individualCount"] == "int64"
+
+
+def test_ingest_rejects_csv_with_unknown_columns(tmp_path):
+    clean_path, _ = _pruned_cleaned_csv(tmp_path)
+    data_path = str(tmp_path / "gbif_cleaned.parquet")
+    convert_data.convert_csv_to_parquet(clean_path, data_path)
+    df = pd.read_csv(clean_path)
+    df.assign(notInDownloads=1).to_csv(clean_path, index=False)
+    size = os.path.getsize(clean_path)
+
+    try:
+        ingest.ingest(_download(tmp_path, 100), data_path, str(tmp_path / "cube.parquet"), clean_path)
+    except ValueError as e:
+        assert "notInDownloads" in str(e)
+    else:
+        raise AssertionError("ingest accepted rows without the CSV's columns")
+    assert os.path.getsize(clean_path) == size
@@ -0,0 +1,24 @@
+import manifest
+from benchmarks.synthetic import write_raw_csv
+from cleaning import run_cleaning
+
+
+def test_cleaning_steps_record_time_and_peak_memory(tmp_path):
+    raw_path = str(tmp_path / "raw.csv")
+    clean_path = str(tmp_path / "gbif_cleaned.csv")
+    write_raw_csv(3000, raw_path, seed=1)
+    run_cleaning(raw_path, clean_path, chunksize=1000, force=True, trace_memory=True)
+
+    run = manifest.load_manifest(manifest.manifest_path(clean_path))["steps"]["clean"]
+    assert set(run["step_memory"]) == set(run["step_seconds"])
+    for peaks in run["step_memory"].values():
+        assert peaks["traced_peak_mb"] >= 0
+        if manifest.current_memory_mb() is not None:
+            assert peaks["peak_memory_mb"] > 0
+
+    metrics = manifest.to_prometheus({"steps": {"clean": run}})
+    for name in run["step_seconds"]:
+        labels = f'{{step="clean",substep="{name}"}}'
+        assert f"gbif_pipeline_seconds{labels}" in metrics
+        assert f"gbif_pipeline_traced_peak_mb{labels}" in metrics
+    assert 'gbif_pipeline_seconds{step="clean",stage="stream_clean"}' in metrics
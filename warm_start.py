@@ -0,0 +1,172 @@
+"""
+Warm-start state for the dashboard's first page.
+
+Everything the unfiltered page shows — the sidebar's filter values, the
+summary metrics, the time series, the top taxa of every level and the map's
+grid cells — is computed once and saved as ``gbif_cleaned.warm.json``
+(convert_data.py writes it after the cube). The file is keyed on the
+version of the dataset and the cube (see ``data_access.dataset_version``),
+so a file written for other data is ignored.
+
+On start the dashboard loads the file and seeds its query cache with it.
+If the file is missing or stale, the state is computed on a background
+thread while the page renders as usual, and saved for the next start.
+"""
+
+import json
+import os
+import threading
+import weakref
+
+import pandas as pd
+
+import aggregates
+import data_access
+import spatial
+from cube import CUBE_PATH, load_cube
+
+# Map zoom and cell budget of the unfiltered page
+DEFAULT_MAP_ZOOM = 3
+DEFAULT_MAP_CELLS = spatial.DEFAULT_MAX_CELLS
+
+METADATA_COLUMNS = ["countryCode", "kingdom", "year"]
+
+# Bumped when the saved state changes meaning, so older files are ignored
+FORMAT_VERSION = 2
+
+
+def warm_start_path(data_path=data_access.DATA_PATH):
+    return os.path.splitext(data_path.rstrip("/\\"))[0] + ".warm.json"
+
+
+def current_version(data_path=data_access.DATA_PATH, cube_path=CUBE_PATH):
+    data_version = data_access.dataset_version(data_path)
+    cube_version = data_access.dataset_version(cube_path)
+    return {
+        "format": FORMAT_VERSION,
+        "data": list(data_version) if data_version else None,
+        "cube": list(cube_version) if cube_version else None,
+    }
+
+
+def compute_warm_start(df, cube=None):
+    """
+    The unfiltered page's state for the dashboard view ``df`` and the
+    occurrence cube (or ``None``): ``{"metadata": {column: values},
+    "entries": {cache name: value}}``, where the names are those the
+    dashboard caches the values under.
+    """
+    metadata = {col: sorted(df[col].dropna().unique().tolist()) for col in METADATA_COLUMNS}
+
+    # The unfiltered page selects every kingdom and year, which leaves out
+    # the rows where they are missing
+    known = df["kingdom"].notna() & df["year"].notna()
+    if not known.all():
+        df = df[known]
+    if cube is not None:
+        view = cube.select(kingdom=metadata["kingdom"], year=metadata["year"])
+    else:
+        view = aggregates.FrameView(df)
+    entries = {
+        ("summary_metrics",): view.summary_metrics(),
+        ("yearly_counts",): view.yearly_counts(),
+        ("monthly_counts",): view.monthly_counts(),
+    }
+    for col in data_access.TAXONOMY_COLUMNS:
+        entries[("top_values", col)] = view.top_values(col)
+    entries[("map_cells", DEFAULT_MAP_ZOOM, DEFAULT_MAP_CELLS)] = spatial.bin_points(
+        df["decimalLatitude"], df["decimalLongitude"], DEFAULT_MAP_ZOOM, DEFAULT_MAP_CELLS
+    )
+    return {"metadata": metadata, "entries": entries}
+
+
+def save_warm_start(state, version, path):
+    entries = []
+    for name, value in state["entries"].items():
+        if isinstance(value, pd.DataFrame):
+            entries.append({"name": list(name), "frame": value.to_dict(orient="list")})
+        else:
+            entries.append({"name": list(name), "value": value})
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": version, "metadata": state["metadata"], "entries": entries}, f)
+    os.replace(tmp_path, path)
+
+
+def load_warm_start(path, version):
+    """The state saved at ``path`` for ``version``, or ``None``."""
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        saved = json.load(f)
+    if saved.get("version") != version:
+        return None
+    entries = {}
+    for entry in saved["entries"]:
+        name = tuple(entry["name"])
+        entries[name] = pd.DataFrame(entry["frame"]) if "frame" in entry else entry["value"]
+    return {"metadata": saved["metadata"], "entries": entries}
+
+
+def write_warm_start(data_path=data_access.DATA_PATH, cube_path=CUBE_PATH):
+    """Compute and save the warm-start state of the dataset at ``data_path``."""
+    state = compute_warm_start(data_access.read_view(path=data_path), load_cube(cube_path, data_path))
+    path = warm_start_path(data_path)
+    save_warm_start(state, current_version(data_path, cube_path), path)
+    return path
+
+
+class BackgroundTask:
+    """Runs ``compute()`` on a daemon thread; ``result()`` waits for it."""
+
+    def __init__(self, compute):
+        self._value = None
+        self._error = None
+        self._thread = threading.Thread(target=self._run, args=(compute,), daemon=True)
+        self._thread.start()
+
+    def _run(self, compute):
+        try:
+            self._value = compute()
+        except Exception as error:
+            self._error = error
+
+    def done(self):
+        return not self._thread.is_alive()
+
+    def result(self):
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+class WarmStart:
+    """
+    The warm-start state of the current data. ``state`` is ``None`` until
+    it is loaded, or computed by ``compute()`` on a background thread and
+    saved to ``path``.
+    """
+
+    def __init__(self, path, version, compute):
+        self.state = load_warm_start(path, version)
+        self._seeded = weakref.WeakSet()
+        self._task = None
+        if self.state is None:
+            self._task = BackgroundTask(lambda: self._fill(path, version, compute))
+
+    def _fill(self, path, version, compute):
+        self.state = compute()
+        save_warm_start(self.state, version, path)
+
+    @property
+    def metadata(self):
+        return self.state["metadata"] if self.state is not None else None
+
+    def seed(self, query_cache, filter_key):
+        """Store the entries in ``query_cache`` under ``filter_key``, once per cache."""
+        if self.state is None or query_cache in self._seeded:
+            return
+        for name, value in self.state["entries"].items():
+            query_cache.put((filter_key, name), value)
+        self._seeded.add(query_cache)